@@ -1,7 +1,14 @@
 """ Backward compatibility import"""
 
 from .functions import (get_json, get_sdf, get_sids, get_properties, request_SDS,
-                        get_synonyms, get_aids, get_cids, get_all_sources, download, request)
+                        get_synonyms, get_aids, get_cids, get_all_sources, download, request, ListKeyJob, wait_all)
 from .compound import Compound, get_compounds, Atom, compounds_to_frame
 from .substance import Substance, get_substances, substances_to_frame
 from .assay import Assay, get_assays
+from .listkey import ListKey, iter_cids, iter_compounds, iter_properties
+from .transport import Session, get_session, set_session
+from .throttle import RateLimiter
+from .retry import Retry
+from .hedge import Hedge
+from .circuit import CircuitBreaker
+from .cache import MemoryCache, SQLiteCache, TieredCache, get_cache, set_cache
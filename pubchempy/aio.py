@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio interface to PubChem, mirroring the blocking functions in :mod:`pubchempy`.
+
+Requires the optional `aiohttp`_ package. Requests share the rate limiter and retry policy of the blocking
+:class:`~pubchempy.Session`, so mixing blocking and asynchronous calls stays within the PubChem usage policy::
+
+    import asyncio
+    from pubchempy import aio
+
+    async def main():
+        return await asyncio.gather(*[aio.get_compounds(name, 'name') for name in ['Aspirin', 'Caffeine']])
+
+.. _aiohttp: https://docs.aiohttp.org
+"""
+
+import asyncio
+import json
+import weakref
+from urllib.error import HTTPError, URLError
+
+from . import functions
+from .circuit import FAILURE_STATUS
+from .compound import Compound, compounds_to_frame
+from .deadlines import limit_timeout
+from .errors import PubChemHTTPError, NotFoundError
+from .logger import createLogger
+from .mapper import PROPERTY_MAP
+from .transport import USER_AGENT, Response, get_session
+
+log = createLogger(__name__)
+
+
+class AsyncSession(object):
+    """Non-blocking HTTP session with a bounded number of concurrent requests.
+
+    :param int limit: (optional) Maximum number of requests in flight at once.
+    """
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self._client = None
+        self._closer = None
+
+    def __repr__(self):
+        return 'AsyncSession(limit=%s)' % self.limit
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_client(self):
+        if self._client is None or self._client.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit)
+            self._client = aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT})
+        return self._client
+
+    async def request(self, url, data=None):
+        """Make a request and return a :class:`~pubchempy.transport.Response`.
+
+        Uses the rate limiter, retry policy and circuit breaker of the shared blocking :class:`~pubchempy.Session`.
+        """
+        retry = get_session().retry
+        attempt = 0
+        while True:
+            try:
+                return await self._request(url, data)
+            except URLError as e:
+                if retry is None or attempt >= retry.total or not retry.is_retryable(e):
+                    raise
+                delay = retry.get_delay(attempt, e)
+                attempt += 1
+                log.warning('Retrying %s in %.2fs after %s (retry %s of %s)', url, delay, e, attempt, retry.total)
+                await asyncio.sleep(delay)
+
+    async def _request(self, url, data=None):
+        breaker = get_session().circuit_breaker
+        if breaker is None:
+            return await self._send(url, data)
+        probe = breaker.acquire()
+        try:
+            response = await self._send(url, data)
+        except HTTPError as e:
+            breaker.record(e.code not in FAILURE_STATUS, probe)
+            raise
+        except URLError:
+            breaker.record(False, probe)
+            raise
+        except BaseException:
+            breaker.record(None, probe)
+            raise
+        breaker.record(True, probe)
+        return response
+
+    async def _send(self, url, data=None):
+        import aiohttp
+        session = get_session()
+        if session.rate_limiter is not None:
+            await asyncio.sleep(session.rate_limiter.reserve())
+        method = 'POST' if data is not None else 'GET'
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data is not None else None
+        timeout = aiohttp.ClientTimeout(total=limit_timeout(None), sock_connect=limit_timeout(session.connect_timeout),
+                                        sock_read=limit_timeout(session.timeout))
+        async with self._semaphore:
+            try:
+                async with self._get_client().request(method, url, data=data, headers=headers,
+                                                      timeout=timeout) as resp:
+                    body = await resp.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                raise URLError(ConnectionError(str(e) or type(e).__name__))
+        if session.rate_limiter is not None:
+            session.rate_limiter.update(resp.headers)
+        response = Response(str(resp.url), resp.status, resp.reason, resp.headers, body)
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, response)
+        return response
+
+    async def close(self):
+        """Close the underlying HTTP client."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_sessions = weakref.WeakKeyDictionary()
+
+
+def get_async_session():
+    """Return the :class:`AsyncSession` for the running event loop, creating it if necessary.
+
+    A session created here is closed automatically when the loop shuts down, for example at the end of
+    :func:`asyncio.run`.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _sessions:
+        session = _sessions[loop] = AsyncSession()
+        _close_at_shutdown(loop, session)
+    return _sessions[loop]
+
+
+def _close_at_shutdown(loop, session):
+    """Close ``session`` when ``loop`` finalizes its asynchronous generators, as :func:`asyncio.run` does on exit."""
+    async def closer():
+        try:
+            yield
+        finally:
+            await session.close()
+    # Keep a reference so the generator is only finalized when the loop shuts down
+    session._closer = closer()
+    loop.create_task(session._closer.__anext__())
+
+
+def set_async_session(session):
+    """Set the :class:`AsyncSession` used for requests made in the running event loop."""
+    _sessions[asyncio.get_running_loop()] = session
+
+
+async def request(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+                  **kwargs):
+    """Construct API request from parameters and return the response."""
+    apiurl, postdata = functions.build_request(identifier, namespace, domain, operation, output, searchtype, **kwargs)
+    try:
+        return await get_async_session().request(apiurl, postdata)
+    except HTTPError as e:
+        raise PubChemHTTPError(e)
+
+
+async def get(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+              **kwargs):
+    """Request wrapper that automatically handles async requests."""
+    if (searchtype and searchtype != 'xref') or namespace in ['formula']:
+        response = (await request(identifier, namespace, domain, None, 'JSON', searchtype, **kwargs)).read()
+        status = json.loads(response.decode())
+        if 'Waiting' in status and 'ListKey' in status['Waiting']:
+            identifier = status['Waiting']['ListKey']
+            namespace = 'listkey'
+            interval = functions.POLL_INTERVAL_MIN
+            while 'Waiting' in status and 'ListKey' in status['Waiting']:
+                await asyncio.sleep(interval)
+                interval = min(functions.POLL_INTERVAL_MAX, interval * functions.POLL_BACKOFF)
+                response = (await request(identifier, namespace, domain, operation, 'JSON', **kwargs)).read()
+                status = json.loads(response.decode())
+            if not output == 'JSON':
+                response = (await request(identifier, namespace, domain, operation, output, **kwargs)).read()
+    else:
+        response = (await request(identifier, namespace, domain, operation, output, searchtype, **kwargs)).read()
+    return response
+
+
+async def get_json(identifier, namespace='cid', domain='compound', operation=None, searchtype=None, **kwargs):
+    """Request wrapper that automatically parses JSON response and supresses NotFoundError."""
+    try:
+        return json.loads((await get(identifier, namespace, domain, operation, 'JSON', searchtype, **kwargs)).decode())
+    except NotFoundError as e:
+        log.info(e)
+        return None
+
+
+async def get_compounds(identifier, namespace='cid', searchtype=None, as_dataframe=False, **kwargs):
+    """Retrieve the specified compound records from PubChem. See :func:`pubchempy.get_compounds`."""
+    results = await get_json(identifier, namespace, searchtype=searchtype, **kwargs)
+    compounds = [Compound(r) for r in results['PC_Compounds']] if results else []
+    if as_dataframe:
+        return compounds_to_frame(compounds)
+    return compounds
+
+
+async def get_properties(properties, identifier, namespace='cid', searchtype=None, as_dataframe=False, **kwargs):
+    """Retrieve the specified properties from PubChem. See :func:`pubchempy.get_properties`."""
+    if isinstance(properties, functions.text_types):
+        properties = properties.split(',')
+    properties = 'property/%s' % ','.join([PROPERTY_MAP.get(p, p) for p in properties])
+    results = await get_json(identifier, namespace, 'compound', properties, searchtype=searchtype, **kwargs)
+    results = results['PropertyTable']['Properties'] if results else []
+    if as_dataframe:
+        import pandas as pd
+        return pd.DataFrame.from_records(results, index='CID')
+    return results
+
+
+async def get_synonyms(identifier, namespace='cid', domain='compound', searchtype=None, **kwargs):
+    results = await get_json(identifier, namespace, domain, 'synonyms', searchtype=searchtype, **kwargs)
+    return results['InformationList']['Information'] if results else []
+
+
+async def get_cids(identifier, namespace='name', domain='compound', searchtype=None, **kwargs):
+    results = await get_json(identifier, namespace, domain, 'cids', searchtype=searchtype, **kwargs)
+    if not results:
+        return []
+    elif 'IdentifierList' in results:
+        return results['IdentifierList']['CID']
+    elif 'InformationList' in results:
+        return results['InformationList']['Information']
+
+
+async def request_SDS(cid):
+    """Retrieve the GHS safety data for a compound. See :func:`pubchempy.request_SDS`."""
+    if not cid:
+        raise ValueError('identifier/cid cannot be None')
+    try:
+        response = await get_async_session().request(
+            functions.API_VIEW + '/{}/JSON?heading=safety+and+hazards'.format(cid))
+        return functions._parse_sds(json.loads(response.read().decode()))
+    except HTTPError as e:
+        log.info(e)
+        raise PubChemHTTPError(e)
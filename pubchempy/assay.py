@@ -1,5 +1,6 @@
 import json
-from .functions import request, get_json
+from .decorators import with_deadline
+from .functions import get, get_json
 from .logger import createLogger
 
 log = createLogger(__name__)
@@ -8,12 +9,13 @@ log = createLogger(__name__)
 class Assay(object):
 
     @classmethod
+    @with_deadline
     def from_aid(cls, aid):
         """Retrieve the Assay record for the specified AID.
 
         :param int aid: The PubChem Assay Identifier (AID).
         """
-        record = json.loads(request(aid, 'aid', 'assay', 'description').read().decode())['PC_AssayContainer'][0]
+        record = json.loads(get(aid, 'aid', 'assay', 'description').decode())['PC_AssayContainer'][0]
         return cls(record)
 
     def __init__(self, record):
@@ -89,6 +91,7 @@ class Assay(object):
         return self.record['assay']['descr']['aid']['version']
 
 
+@with_deadline
 def get_assays(identifier, namespace='aid', **kwargs):
     """Retrieve the specified assay records from PubChem.
 
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Splitting of large identifier lists into server-friendly chunks.
+
+PubChem times out or rejects requests for too many records at once, so :class:`Batcher` splits long lists of CIDs,
+SIDs or AIDs into chunks, requests them concurrently and merges the results back together in input order. The chunk
+size adapts to how quickly the server responds, separately for each kind of request. Chunks that fail because of a bad
+identifier can be bisected to isolate it, so the rest of the batch is still retrieved.
+
+Going the other way, :class:`MicroBatcher` collects single-identifier lookups made concurrently by different threads
+and sends them as one request.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+
+from .deadlines import remaining
+from .errors import BadRequestError, DeadlineExceededError, NotFoundError, TimeoutError as ServerTimeoutError
+from .logger import createLogger
+from .retry import skip_retry
+
+log = createLogger(__name__)
+
+
+#: Namespaces whose identifier lists can be split into chunks.
+CHUNKABLE_NAMESPACES = {'cid', 'sid', 'aid'}
+
+
+def merge_json(results):
+    """Merge a list of JSON responses for chunks of a request into a single response.
+
+    Lists (e.g. ``PC_Compounds`` or ``PropertyTable.Properties``) are concatenated in order. ``None`` results, from
+    chunks where nothing was found, are skipped.
+    """
+    merged = None
+    for result in results:
+        if result is None:
+            continue
+        merged = result if merged is None else _merge(merged, result)
+    return merged
+
+
+def _merge(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key, value in b.items():
+            a[key] = _merge(a[key], value) if key in a else value
+        return a
+    if isinstance(a, list) and isinstance(b, list):
+        return a + b
+    return a
+
+
+class BatchResult(list):
+    """A list of results from a batch request, along with the identifiers that could not be retrieved.
+
+    Returned by search functions when ``errors='collect'``.
+    """
+
+    def __init__(self, results=(), failures=()):
+        super().__init__(results)
+        self.failures = list(failures)
+        """List of ``(identifier, error)`` pairs for identifiers that could not be retrieved."""
+
+    def __repr__(self):
+        return 'BatchResult(%s, failures=%s)' % (list.__repr__(self), self.failures)
+
+
+class Batcher(object):
+    """Splits identifier lists into chunks and fetches them concurrently.
+
+    When ``adaptive`` is enabled, the chunk size is tuned while requests run, separately for each kind of request (for
+    example 3D compound records are much heavier than CIDs). The size grows while responses arrive well within
+    ``target_latency``, shrinks when they are slower, and is halved when the server returns a 504 timeout, in which
+    case the failed chunk is split in two and resubmitted. Chunks that time out are split straight away rather than
+    first being retried by the :class:`~pubchempy.Retry` policy. Tuned sizes are remembered for later requests.
+
+    :param int chunk_size: (optional) Initial maximum number of identifiers in each request.
+    :param int max_workers: (optional) Maximum number of chunks requested at once.
+    :param bool adaptive: (optional) Tune the chunk size based on observed latency and timeouts.
+    :param float target_latency: (optional) Response time in seconds that the chunk size is tuned towards.
+    :param int min_chunk_size: (optional) Smallest chunk size used when adapting.
+    :param int max_chunk_size: (optional) Largest chunk size used when adapting.
+    """
+
+    def __init__(self, chunk_size=200, max_workers=4, adaptive=True, target_latency=5.0, min_chunk_size=1,
+                 max_chunk_size=2000):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Batcher(chunk_size=%s, max_workers=%s)' % (self.chunk_size, self.max_workers)
+
+    def size(self, key=None):
+        """Return the current chunk size for the given kind of request."""
+        with self._lock:
+            return self._sizes.get(key, self.chunk_size)
+
+    def chunks(self, identifiers, key=None):
+        """Split a list of identifiers into chunks using the current chunk size."""
+        size = self.size(key)
+        return [identifiers[i:i + size] for i in range(0, len(identifiers), size)]
+
+    def _observe(self, key, count, elapsed):
+        """Grow or shrink the chunk size for ``key`` after a chunk of ``count`` identifiers took ``elapsed`` seconds."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            size = self._sizes.get(key, self.chunk_size)
+            if elapsed > self.target_latency:
+                size = max(self.min_chunk_size, min(size, int(count * 0.75)))
+            elif elapsed < self.target_latency / 2 and count >= size:
+                size = min(self.max_chunk_size, int(size * 1.5) + 1)
+            self._sizes[key] = size
+
+    def _timed_out(self, key, count):
+        """Halve the chunk size for ``key`` after a chunk of ``count`` identifiers timed out."""
+        with self._lock:
+            size = self._sizes.get(key, self.chunk_size)
+            self._sizes[key] = max(self.min_chunk_size, min(size, count) // 2)
+            log.info('Request timed out, reducing chunk size for %s to %s', key, self._sizes[key])
+
+    def map(self, fetch, identifiers, key=None, failures=None):
+        """Call ``fetch`` with chunks of ``identifiers`` and return the results in input order.
+
+        If a list is given as ``failures``, a chunk that fails with :class:`~pubchempy.BadRequestError` or
+        :class:`~pubchempy.NotFoundError` is bisected and its halves resubmitted until the bad identifiers are
+        isolated. These are appended to ``failures`` as ``(identifier, error)`` pairs instead of raising, and results
+        are returned for everything else.
+
+        :param fetch: Function that takes a list of identifiers and returns the result for them.
+        :param identifiers: The list of identifiers to split.
+        :param key: (optional) Hashable description of the kind of request, used to remember the tuned chunk size.
+        :param list failures: (optional) List to collect failed identifiers in, rather than raising.
+        """
+        identifiers = list(identifiers)
+        results = {}
+        failed = {}
+        position = 0
+        retries = deque()
+        running = {}
+
+        def timed_fetch(chunk):
+            start = time.monotonic()
+            if self.adaptive and len(chunk) > 1:
+                # A 504 means the chunk was too big, so split it straight away rather than retrying it as it is
+                with skip_retry(504):
+                    return fetch(chunk), time.monotonic() - start
+            return fetch(chunk), time.monotonic() - start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while position < len(identifiers) or retries or running:
+                # Keep the workers busy, preferring chunks that need to be resubmitted
+                while len(running) < self.max_workers and (retries or position < len(identifiers)):
+                    if retries:
+                        offset, chunk = retries.popleft()
+                    else:
+                        offset, chunk = position, identifiers[position:position + self.size(key)]
+                        position += len(chunk)
+                    # Run in a copy of the caller's context so any deadline applies to the chunk too
+                    future = executor.submit(contextvars.copy_context().run, timed_fetch, chunk)
+                    running[future] = (offset, chunk)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset, chunk = running.pop(future)
+                    try:
+                        results[offset], elapsed = future.result()
+                    except ServerTimeoutError:
+                        if not self.adaptive or len(chunk) <= 1:
+                            raise
+                        self._timed_out(key, len(chunk))
+                        half = len(chunk) // 2
+                        retries.extend([(offset, chunk[:half]), (offset + half, chunk[half:])])
+                        continue
+                    except (BadRequestError, NotFoundError) as e:
+                        if failures is None:
+                            raise
+                        if len(chunk) == 1:
+                            log.warning('Failed to retrieve %s: %s', chunk[0], e)
+                            failed[offset] = (chunk[0], e)
+                            continue
+                        # Bisect to isolate the bad identifiers
+                        half = len(chunk) // 2
+                        retries.extend([(offset, chunk[:half]), (offset + half, chunk[half:])])
+                        continue
+                    self._observe(key, len(chunk), elapsed)
+        if len(results) > 1:
+            log.debug('Split %s identifiers into %s chunks', len(identifiers), len(results))
+        if failures is not None:
+            failures.extend(failed[offset] for offset in sorted(failed))
+        return [results[offset] for offset in sorted(results)]
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the shared :class:`Batcher` used to split large requests."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = Batcher()
+        return _batcher
+
+
+def set_batcher(batcher):
+    """Replace the shared :class:`Batcher` used to split large requests."""
+    global _batcher
+    with _batcher_lock:
+        _batcher = batcher
+
+
+class _PendingBatch(object):
+    """Identifiers waiting to be sent together, with a future for each."""
+
+    def __init__(self):
+        self.futures = {}
+        self.timer = None
+
+
+class MicroBatcher(object):
+    """Collects single-identifier lookups made at around the same time and fetches them in one request.
+
+    The first lookup for a kind of request opens a batch, which is sent after ``window`` seconds or as soon as it holds
+    ``max_size`` identifiers, whichever comes first. Each caller then receives its own result. This trades a few
+    milliseconds of latency for far fewer requests when many threads look up individual records at once.
+
+    If a batch fails with :class:`~pubchempy.BadRequestError`, its identifiers are retried one at a time so a single
+    bad identifier only fails its own lookup.
+
+    :param float window: (optional) Time in seconds to wait for more identifiers before sending a batch.
+    :param int max_size: (optional) Maximum number of identifiers in a batch.
+    """
+
+    def __init__(self, window=0.02, max_size=100):
+        self.window = window
+        self.max_size = max_size
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'MicroBatcher(window=%s, max_size=%s)' % (self.window, self.max_size)
+
+    def call(self, key, identifier, fetch):
+        """Return the result for ``identifier``, fetching it in a batch with other concurrent calls for ``key``.
+
+        If a batch sent by another caller fails with :class:`~pubchempy.errors.DeadlineExceededError` from that
+        caller's deadline, the lookup is tried again as long as this caller still has time left.
+
+        :param key: Hashable description of the kind of request. Only identifiers with the same key are batched.
+        :param identifier: The identifier to look up.
+        :param fetch: Function that takes a list of identifiers and returns a dict of results keyed by identifier.
+                      Identifiers missing from the dict get a result of ``None``.
+        """
+        while True:
+            full = None
+            with self._lock:
+                batch = self._pending.get(key)
+                if batch is None:
+                    batch = self._pending[key] = _PendingBatch()
+                    batch.timer = threading.Timer(self.window, self._flush, (key, batch, fetch))
+                    batch.timer.daemon = True
+                    batch.timer.start()
+                future = batch.futures.get(identifier)
+                if future is None:
+                    future = batch.futures[identifier] = Future()
+                if len(batch.futures) >= self.max_size:
+                    full = batch
+            if full is not None:
+                # The batch is full, so send it now from this thread rather than waiting for the timer
+                full.timer.cancel()
+                self._flush(key, full, fetch)
+            try:
+                return future.result(remaining())
+            except FutureTimeoutError:
+                raise DeadlineExceededError('Batched lookup of %s did not complete within its deadline' % identifier)
+            except DeadlineExceededError as e:
+                # A batch flushed by another caller runs under that caller's deadline, which shouldn't fail this one
+                left = remaining()
+                if full is not None or (left is not None and left <= 0):
+                    raise
+                log.debug('Batch ran out of time, trying %s again: %s', identifier, e)
+
+    def _flush(self, key, batch, fetch):
+        with self._lock:
+            if self._pending.get(key) is not batch:
+                return
+            del self._pending[key]
+        identifiers = list(batch.futures)
+        log.debug('Sending batch of %s identifiers for %s', len(identifiers), key)
+        try:
+            results = fetch(identifiers)
+        except BadRequestError as e:
+            if len(identifiers) == 1:
+                batch.futures[identifiers[0]].set_exception(e)
+                return
+            log.info('Batch failed, retrying identifiers individually: %s', e)
+            for identifier in identifiers:
+                self._resolve(batch.futures[identifier], fetch, identifier)
+            return
+        except Exception as e:
+            for future in batch.futures.values():
+                future.set_exception(e)
+            return
+        for identifier, future in batch.futures.items():
+            future.set_result(results.get(identifier))
+
+    @staticmethod
+    def _resolve(future, fetch, identifier):
+        try:
+            future.set_result(fetch([identifier]).get(identifier))
+        except Exception as e:
+            future.set_exception(e)
+
+
+_micro_batcher = None
+
+
+def get_micro_batcher():
+    """Return the :class:`MicroBatcher` used for single-identifier lookups, or ``None`` if micro-batching is off."""
+    return _micro_batcher
+
+
+def set_micro_batcher(micro_batcher):
+    """Install a :class:`MicroBatcher` for single-identifier lookups. Pass ``None`` to turn micro-batching off."""
+    global _micro_batcher
+    _micro_batcher = micro_batcher
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+Response caching to avoid fetching the same data from PubChem repeatedly.
+
+Caching is opt-in. Once a cache is installed with :func:`set_cache`, every request made through ``get`` (and so
+:func:`~pubchempy.get_compounds`, :func:`~pubchempy.get_properties`, :meth:`Compound.from_cid
+<pubchempy.Compound.from_cid>` and friends) and :func:`~pubchempy.request_SDS` is looked up in the cache first.
+:class:`MemoryCache` keeps responses in the current process, :class:`SQLiteCache` keeps them on disk, and
+:class:`TieredCache` combines the two.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from .errors import CircuitOpenError, NotFoundError
+from .logger import createLogger
+from .singleflight import coalesce
+
+log = createLogger(__name__)
+
+
+#: Default time in seconds that cached responses are considered fresh.
+DEFAULT_TTL = 7 * 24 * 3600
+
+#: Default time in seconds that a record is remembered as not found.
+DEFAULT_NEGATIVE_TTL = 3600
+
+class _NotFound(object):
+    """Marker for a request that found nothing, kept apart from any real response (including an empty one)."""
+
+    def __repr__(self):
+        return 'NOT_FOUND'
+
+
+#: Value stored in place of a response for requests that failed with :class:`~pubchempy.NotFoundError`.
+NOT_FOUND = _NotFound()
+
+
+def make_key(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+             **kwargs):
+    """Return a normalised cache key for a request with the given parameters."""
+    if isinstance(identifier, (list, tuple)):
+        identifier = ','.join(str(x) for x in identifier)
+    kwargs = sorted((k, str(v)) for k, v in kwargs.items() if v is not None)
+    return json.dumps([domain, namespace, searchtype, str(identifier), operation, output, kwargs])
+
+
+def operation_name(operation):
+    """Return the name of an operation used to look up its TTL, e.g. ``'property'`` for ``'property/XLogP'``."""
+    return operation.split('/')[0] if operation else 'record'
+
+
+class BaseCache(object):
+    """Base class for response caches, with per-operation TTLs and hit/miss statistics.
+
+    Requests that fail with :class:`~pubchempy.NotFoundError` are remembered too, for ``negative_ttl`` seconds, so
+    repeatedly looking up an unknown name doesn't cost a request each time.
+
+    :param float ttl: (optional) Default time in seconds that cached responses are considered fresh.
+    :param dict ttls: (optional) TTLs for specific operations, e.g. ``{'synonyms': 3600, 'sds': 86400}``.
+    :param float negative_ttl: (optional) Time in seconds that not found results are remembered.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, ttls=None, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        """Number of lookups that found a fresh entry."""
+        self.misses = 0
+        """Number of lookups that found no fresh entry."""
+
+    def ttl_for(self, operation):
+        """Return the TTL in seconds for responses to the given operation."""
+        return self.ttls.get(operation_name(operation), self.ttl)
+
+    @property
+    def stats(self):
+        """Dictionary of cache statistics."""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def get(self, key, stale=False):
+        """Return the cached value for ``key``, or ``None`` if there is no fresh entry.
+
+        Returns :data:`NOT_FOUND` if the request for ``key`` is remembered as having found nothing.
+
+        :param bool stale: (optional) Also return entries that have expired.
+        """
+        entry = self.get_entry(key, stale)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key, stale=False):
+        """Return a ``(value, ttl)`` pair for ``key``, where ``ttl`` is the number of seconds until the entry expires,
+        or ``None`` if there is no fresh entry.
+
+        :param bool stale: (optional) Also return entries that have expired, which have a negative ``ttl``.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+        raise NotImplementedError
+
+    def put(self, key, value, operation=None):
+        """Store ``value`` under ``key`` using the TTL for the given operation."""
+        self.set(key, value, self.ttl_for(operation))
+
+    def put_not_found(self, key):
+        """Remember that the request for ``key`` found nothing, for ``negative_ttl`` seconds."""
+        self.set(key, NOT_FOUND, self.negative_ttl)
+
+    def delete(self, key):
+        """Remove the entry for ``key``, if present."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all entries."""
+        raise NotImplementedError
+
+
+class SQLiteCache(BaseCache):
+    """Persistent cache stored in an SQLite database, shared between processes and kept between runs.
+
+    Responses are stored compressed, and not found results are stored with no value. When the total size of the stored
+    responses exceeds ``max_size``, the least recently used entries are evicted.
+
+    :param str path: (optional) Path to the database file. Defaults to ``~/.cache/pubchempy/responses.sqlite``.
+    :param int max_size: (optional) Maximum total size in bytes of the compressed responses.
+    :param float ttl: (optional) Default time in seconds that cached responses are considered fresh.
+    :param dict ttls: (optional) TTLs for specific operations, e.g. ``{'synonyms': 3600, 'sds': 86400}``.
+    :param float negative_ttl: (optional) Time in seconds that not found results are remembered.
+    """
+
+    def __init__(self, path=None, max_size=512 * 1024 * 1024, ttl=DEFAULT_TTL, ttls=None,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL):
+        super().__init__(ttl, ttls, negative_ttl)
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), '.cache', 'pubchempy', 'responses.sqlite')
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, '
+                               'size INTEGER, expires REAL, accessed REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def __repr__(self):
+        return 'SQLiteCache(%r)' % self.path
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.sha256(key.encode('utf8')).hexdigest()
+
+    def get_entry(self, key, stale=False):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires FROM responses WHERE key = ?',
+                                     (self._hash(key),)).fetchone()
+            if row is None or (row[1] < now and not stale):
+                self._record(False)
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, self._hash(key)))
+            self._record(True)
+        return NOT_FOUND if row[0] is None else zlib.decompress(row[0]), row[1] - now
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        data = None if value is NOT_FOUND else zlib.compress(value)
+        size = len(data) if data is not None else 0
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (self._hash(key),)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                               (self._hash(key), data, size, now + ttl, now))
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is within 90% of its maximum size."""
+        target = self.max_size * 0.9
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        evict = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if self._size <= target:
+                break
+            evict.append((key,))
+            self._size -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', evict)
+        log.debug('Evicted %s entries from %s', len(evict), self.path)
+
+    def delete(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM responses WHERE key = ?', (self._hash(key),)).fetchone()
+            if row:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (self._hash(key),))
+                self._size -= row[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._size = 0
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryCache(BaseCache):
+    """Bounded in-process cache, for fast repeated lookups in long-running programs.
+
+    When more than ``max_entries`` responses are stored, the least recently used entries are evicted.
+
+    :param int max_entries: (optional) Maximum number of responses stored.
+    :param float ttl: (optional) Default time in seconds that cached responses are considered fresh.
+    :param dict ttls: (optional) TTLs for specific operations, e.g. ``{'synonyms': 3600, 'sds': 86400}``.
+    :param float negative_ttl: (optional) Time in seconds that not found results are remembered.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, ttls=None, negative_ttl=300):
+        super().__init__(ttl, ttls, negative_ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'MemoryCache(max_entries=%s)' % self.max_entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, key, stale=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] < now and not stale):
+                self._record(False)
+                return None
+            self._entries.move_to_end(key)
+            self._record(True)
+            return entry[0], entry[1] - now
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache(BaseCache):
+    """Several caches checked in order, typically a fast :class:`MemoryCache` in front of a :class:`SQLiteCache`.
+
+    Fresh responses found in a later cache are copied into the earlier ones, to expire no later than the original. New
+    responses are stored in all of them, each using its own TTLs.
+
+    Usage::
+
+        set_cache(TieredCache(MemoryCache(), SQLiteCache()))
+    """
+
+    def __init__(self, *caches):
+        super().__init__()
+        self.caches = list(caches)
+
+    def __repr__(self):
+        return 'TieredCache(%s)' % ', '.join(repr(c) for c in self.caches)
+
+    def __len__(self):
+        return len(self.caches[-1]) if self.caches else 0
+
+    @property
+    def stats(self):
+        stats = super().stats
+        stats['tiers'] = [c.stats for c in self.caches]
+        return stats
+
+    def get_entry(self, key, stale=False):
+        for i, cache in enumerate(self.caches):
+            entry = cache.get_entry(key, stale)
+            if entry is not None:
+                value, ttl = entry
+                # Copies expire no later than the original, and expired entries are never copied
+                if ttl > 0:
+                    for earlier in self.caches[:i]:
+                        default = earlier.negative_ttl if value is NOT_FOUND else earlier.ttl
+                        earlier.set(key, value, min(ttl, default))
+                self._record(True)
+                return entry
+        self._record(False)
+        return None
+
+    def set(self, key, value, ttl=None):
+        for cache in self.caches:
+            cache.set(key, value, ttl)
+
+    def put(self, key, value, operation=None):
+        for cache in self.caches:
+            cache.put(key, value, operation)
+
+    def put_not_found(self, key):
+        for cache in self.caches:
+            cache.put_not_found(key)
+
+    def delete(self, key):
+        for cache in self.caches:
+            cache.delete(key)
+
+    def clear(self):
+        for cache in self.caches:
+            cache.clear()
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the installed response cache, or ``None`` if caching is disabled."""
+    return _cache
+
+
+def set_cache(cache):
+    """Install a response cache for all requests. Pass ``None`` to disable caching."""
+    global _cache
+    _cache = cache
+
+
+def cached(key, operation, fetch):
+    """Return the cached response for ``key``, or call ``fetch`` and cache its result if there is none.
+
+    Concurrent calls with the same ``key`` share a single call to ``fetch``, whether or not a cache is installed. If
+    ``fetch`` raises :class:`~pubchempy.NotFoundError`, that is cached as well and raised again for later calls. If the
+    circuit breaker is open, an expired cache entry is returned rather than failing.
+    """
+    cache = _cache
+    if cache is None:
+        return coalesce(key, fetch)
+    value = cache.get(key)
+    if value is None:
+        def fetch_and_store():
+            try:
+                value = fetch()
+            except NotFoundError:
+                cache.put_not_found(key)
+                raise
+            cache.put(key, value, operation)
+            return value
+        try:
+            value = coalesce(key, fetch_and_store)
+        except CircuitOpenError as e:
+            value = cache.get(key, stale=True)
+            if value is None:
+                raise
+            log.warning('Serving stale cached response: %s', e)
+    if value is NOT_FOUND:
+        raise NotFoundError('The input record was not found (cached)')
+    return value
+
+
+def invalidate(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+               **kwargs):
+    """Remove the cached response for a request, so the next identical request fetches it from PubChem again.
+
+    Takes the same parameters as :func:`~pubchempy.get`.
+    """
+    if _cache is not None:
+        _cache.delete(make_key(identifier, namespace, domain, operation, output, searchtype, **kwargs))
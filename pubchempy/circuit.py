@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker that stops sending requests while PubChem is down.
+
+During outages and maintenance windows, every request would otherwise wait for a connect timeout or a 503 response.
+Once too many recent requests have failed, :class:`CircuitBreaker` opens and further requests fail immediately with
+:class:`~pubchempy.errors.CircuitOpenError` (or are served stale from the cache, if one is installed). After a while a
+few test requests are let through, and the circuit closes again once they succeed.
+"""
+
+import threading
+import time
+from collections import deque
+
+from .errors import CircuitOpenError
+from .logger import createLogger
+
+log = createLogger(__name__)
+
+
+#: HTTP status codes that count as failures. Other error statuses, such as 404, mean the server is working.
+FAILURE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """Fails requests fast after the server has been failing, and probes to detect when it recovers.
+
+    The circuit opens when at least ``min_requests`` requests were made in the last ``window`` seconds and the
+    fraction that failed with a connection error or a :data:`FAILURE_STATUS` response reached ``failure_rate``. After
+    ``recovery_timeout`` seconds it becomes half-open and lets ``probes`` test requests through. If they succeed the
+    circuit closes, otherwise it opens again.
+
+    :param float failure_rate: (optional) Fraction of failed requests at which the circuit opens.
+    :param int min_requests: (optional) Minimum number of recent requests before the circuit can open.
+    :param float window: (optional) Time in seconds over which the failure rate is measured.
+    :param float recovery_timeout: (optional) Time in seconds the circuit stays open before probing.
+    :param int probes: (optional) Number of test requests allowed at once while half-open.
+    """
+
+    def __init__(self, failure_rate=0.5, min_requests=10, window=60.0, recovery_timeout=30.0, probes=1):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.probes = probes
+        self._state = CLOSED
+        self._opened = None
+        self._probing = 0
+        self._trial = 0
+        self._outcomes = deque()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'CircuitBreaker(%s)' % self.state
+
+    @property
+    def state(self):
+        """The current state: ``'closed'``, ``'open'`` or ``'half-open'``."""
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened >= self.recovery_timeout:
+            log.info('Circuit half-open, sending test request')
+            self._state = HALF_OPEN
+            self._probing = 0
+            self._trial += 1
+
+    def acquire(self):
+        """Raise :class:`~pubchempy.errors.CircuitOpenError` if a request may not be sent now.
+
+        Returns a token identifying the test request if the circuit is half-open, or ``None`` for an ordinary request.
+        Each successful call must be followed by a call to :meth:`record` with the returned token.
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == OPEN:
+                retry_in = self.recovery_timeout - (time.monotonic() - self._opened)
+                raise CircuitOpenError('PubChem appears to be unavailable, not retrying for %.0fs' % retry_in)
+            if self._state == HALF_OPEN:
+                if self._probing >= self.probes:
+                    raise CircuitOpenError('PubChem appears to be unavailable, waiting for test request')
+                self._probing += 1
+                return self._trial
+            return None
+
+    def record(self, success, probe=None):
+        """Record the outcome of a request allowed by :meth:`acquire`.
+
+        Only test requests sent while the circuit is half-open can close or reopen it. Outcomes of ordinary requests
+        that were sent before the circuit opened are ignored once it is no longer closed.
+
+        :param success: ``True`` if the server responded normally, ``False`` if it failed, or ``None`` if the request
+                        was abandoned without an outcome.
+        :param probe: (optional) The token returned by :meth:`acquire` for this request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if probe is not None:
+                if self._state != HALF_OPEN or probe != self._trial:
+                    return
+                self._probing -= 1
+                if success is None:
+                    return
+                if success:
+                    log.info('Circuit closed, PubChem is responding again')
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+            if success is None or self._state != CLOSED:
+                return
+            self._outcomes.append((now, success))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_requests and failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+    def _open(self, now):
+        log.warning('Circuit opened after repeated failures, failing requests for %ss', self.recovery_timeout)
+        self._state = OPEN
+        self._opened = now
+        self._outcomes.clear()
+
+    def reset(self):
+        """Close the circuit and forget recent failures."""
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._probing = 0
@@ -1,6 +1,8 @@
 import json
-from .functions import get_json, request, _parse_prop, request_SDS
-from .decorators import deprecated, memoized_property
+from .functions import (get, get_json, get_json_chunked, _parse_prop, _index_props, _prop_key, request_SDS,
+                        _collect_failures, PROP_INDEX_FIELDS)
+from .batch import BatchResult
+from .decorators import deprecated, memoized_property, with_deadline
 from .mapper import ELEMENTS, CoordinateType, BondType
 from .errors import ResponseParseError, NotFoundError
 from itertools import zip_longest
@@ -11,6 +13,9 @@ log = createLogger(__name__)
 class Atom(object):
     """Class to represent an atom in a :class:`~pubchempy.Compound`."""
 
+    # Compounds can have many atoms, so avoid a per-instance __dict__
+    __slots__ = ('aid', 'number', 'x', 'y', 'z', 'charge')
+
     def __init__(self, aid, number, x=None, y=None, z=None, charge=0):
         """Initialize with an atom ID, atomic number, coordinates and optional change.
 
@@ -50,7 +55,12 @@ class Atom(object):
 
     @deprecated('Dictionary style access to Atom attributes is deprecated')
     def __setitem__(self, prop, val):
-        """Allow dict-style setting of attributes to ease transition from when atoms were dicts."""
+        """Allow dict-style setting of attributes to ease transition from when atoms were dicts.
+
+        Only the existing attributes can be set, as Atoms no longer store arbitrary keys.
+        """
+        if prop not in self.__slots__:
+            raise KeyError('%s has no attribute %r to set' % (type(self).__name__, prop))
         setattr(self, prop, val)
 
     @deprecated('Dictionary style access to Atom attributes is deprecated')
@@ -68,10 +78,13 @@ class Atom(object):
     def to_dict(self):
         """Return a dictionary containing Atom data."""
         data = {'aid': self.aid, 'number': self.number, 'element': self.element}
-        for coord in {'x', 'y', 'z'}:
-            if getattr(self, coord) is not None:
-                data[coord] = getattr(self, coord)
-        if self.charge is not 0:
+        if self.x is not None:
+            data['x'] = self.x
+        if self.y is not None:
+            data['y'] = self.y
+        if self.z is not None:
+            data['z'] = self.z
+        if self.charge != 0:
             data['charge'] = self.charge
         return data
 
@@ -90,6 +103,8 @@ class Atom(object):
 class Bond(object):
     """Class to represent a bond between two atoms in a :class:`~pubchempy.Compound`."""
 
+    __slots__ = ('aid1', 'aid2', 'order', 'style')
+
     def __init__(self, aid1, aid2, order=BondType.SINGLE, style=None):
         """Initialize with begin and end atom IDs, bond order and bond style.
 
@@ -122,7 +137,12 @@ class Bond(object):
 
     @deprecated('Dictionary style access to Bond attributes is deprecated')
     def __setitem__(self, prop, val):
-        """Allow dict-style setting of attributes to ease transition from when bonds were dicts."""
+        """Allow dict-style setting of attributes to ease transition from when bonds were dicts.
+
+        Only the existing attributes can be set, as Bonds no longer store arbitrary keys.
+        """
+        if prop not in self.__slots__:
+            raise KeyError('%s has no attribute %r to set' % (type(self).__name__, prop))
         setattr(self, prop, val)
 
     @deprecated('Dictionary style access to Atom attributes is deprecated')
@@ -161,8 +181,11 @@ class Compound(object):
         :param dict record: A compound record returned by the PubChem PUG REST service.
         """
         self._record = None
-        self._atoms = {}
-        self._bonds = {}
+        self._atoms = None
+        self._bonds = None
+        self._atom_list = None
+        self._bond_list = None
+        self._prop_indexes = {}
         self.record = record
 
     @property
@@ -174,39 +197,70 @@ class Compound(object):
     def record(self, record):
         self._record = record
         #log.debug('Created %s' % self)
+        # Atoms, bonds and property indexes are derived from the record when first needed
+        self._atoms = None
+        self._bonds = None
+        self._atom_list = None
+        self._bond_list = None
+        self._prop_indexes = {}
+
+    def _parse_prop(self, search, proplist):
+        """Extract property value from a props list in the record using the given urn search filter.
+
+        Each props list is indexed the first time it is searched, so later lookups don't need to scan it.
+        """
+        key = _prop_key(search)
+        if tuple(field for field, _ in key) not in PROP_INDEX_FIELDS:
+            return _parse_prop(search, proplist)
+        entry = self._prop_indexes.get(id(proplist))
+        if entry is None or entry[0] is not proplist:
+            entry = self._prop_indexes[id(proplist)] = (proplist, _index_props(proplist))
+        return entry[1].get(key)
+
+    def validate(self):
+        """Check that the atoms and bonds in the record are consistent.
+
+        Atoms and bonds are only parsed when first used, so a malformed record is otherwise not detected until then.
+
+        :raises ResponseParseError: If the atoms, coordinates or bonds in the record don't match up.
+        """
         self._setup_atoms()
         self._setup_bonds()
 
     def _setup_atoms(self):
         """Derive Atom objects from the record."""
-        # Delete existing atoms
-        self._atoms = {}
+        # Build into a new dict, so a failed parse doesn't leave atoms half set up
+        atoms = {}
         # Create atoms
         aids = self.record['atoms']['aid']
         elements = self.record['atoms']['element']
         if not len(aids) == len(elements):
             raise ResponseParseError('Error parsing atom elements')
         for aid, element in zip(aids, elements):
-            self._atoms[aid] = Atom(aid=aid, number=element)
+            atoms[aid] = Atom(aid=aid, number=element)
         # Add coordinates
         if 'coords' in self.record:
             coord_ids = self.record['coords'][0]['aid']
             xs = self.record['coords'][0]['conformers'][0]['x']
             ys = self.record['coords'][0]['conformers'][0]['y']
             zs = self.record['coords'][0]['conformers'][0].get('z', [])
-            if not len(coord_ids) == len(xs) == len(ys) == len(self._atoms) or (zs and not len(zs) == len(coord_ids)):
+            if not len(coord_ids) == len(xs) == len(ys) == len(atoms) or (zs and not len(zs) == len(coord_ids)):
                 raise ResponseParseError('Error parsing atom coordinates')
             for aid, x, y, z in zip_longest(coord_ids, xs, ys, zs):
-                self._atoms[aid].set_coordinates(x, y, z)
+                atoms[aid].set_coordinates(x, y, z)
         # Add charges
         if 'charge' in self.record['atoms']:
             for charge in self.record['atoms']['charge']:
-                self._atoms[charge['aid']].charge = charge['value']
+                atoms[charge['aid']].charge = charge['value']
+        self._atoms = atoms
+        self._atom_list = None
 
     def _setup_bonds(self):
         """Derive Bond objects from the record."""
-        self._bonds = {}
+        bonds = {}
         if 'bonds' not in self.record:
+            self._bonds = bonds
+            self._bond_list = None
             return
         # Create bonds
         aid1s = self.record['bonds']['aid1']
@@ -215,16 +269,19 @@ class Compound(object):
         if not len(aid1s) == len(aid2s) == len(orders):
             raise ResponseParseError('Error parsing bonds')
         for aid1, aid2, order in zip(aid1s, aid2s, orders):
-            self._bonds[frozenset((aid1, aid2))] = Bond(aid1=aid1, aid2=aid2, order=order)
+            bonds[frozenset((aid1, aid2))] = Bond(aid1=aid1, aid2=aid2, order=order)
         # Add styles
         if 'coords' in self.record and 'style' in self.record['coords'][0]['conformers'][0]:
             aid1s = self.record['coords'][0]['conformers'][0]['style']['aid1']
             aid2s = self.record['coords'][0]['conformers'][0]['style']['aid2']
             styles = self.record['coords'][0]['conformers'][0]['style']['annotation']
             for aid1, aid2, style in zip(aid1s, aid2s, styles):
-                self._bonds[frozenset((aid1, aid2))].style = style
+                bonds[frozenset((aid1, aid2))].style = style
+        self._bonds = bonds
+        self._bond_list = None
 
     @classmethod
+    @with_deadline
     def from_cid(cls, cid, **kwargs):
         """Retrieve the Compound record for the specified CID.
 
@@ -234,7 +291,24 @@ class Compound(object):
 
         :param int cid: The PubChem Compound Identifier (CID).
         """
-        record = json.loads(request(cid, **kwargs).read().decode())['PC_Compounds'][0]
+        record = json.loads(get(cid, **kwargs).decode())['PC_Compounds'][0]
+        return cls(record)
+
+    @classmethod
+    async def from_cid_async(cls, cid, **kwargs):
+        """Retrieve the Compound record for the specified CID without blocking the event loop.
+
+        Usage::
+
+            c = await Compound.from_cid_async(6819)
+
+        Requires aiohttp. See :mod:`pubchempy.aio`.
+
+        :param int cid: The PubChem Compound Identifier (CID).
+        """
+        from .aio import request as request_async
+        response = await request_async(cid, **kwargs)
+        record = json.loads(response.read().decode())['PC_Compounds'][0]
         return cls(record)
 
     def __repr__(self):
@@ -250,7 +324,7 @@ class Compound(object):
         because they each require an extra request.
         """
         if not properties:
-            skip = {'aids', 'sids', 'synonyms'}
+            skip = {'aids', 'sids', 'synonyms', 'coords', 'atomic_numbers', 'charges'}
             properties = [p for p in dir(Compound) if isinstance(getattr(Compound, p), property) and p not in skip]
         return {p: [i.to_dict() for i in getattr(self, p)] if p in {'atoms', 'bonds'} else getattr(self, p) for p in properties}
 
@@ -280,17 +354,104 @@ class Compound(object):
     @property
     def elements(self):
         """List of element symbols for atoms in this Compound."""
-        return [a.element for a in self.atoms]
+        return [a.element for a in self._sorted_atoms()]
+
+    def _sorted_atoms(self):
+        if self._atom_list is None:
+            if self._atoms is None:
+                self._setup_atoms()
+            self._atom_list = sorted(self._atoms.values(), key=lambda x: x.aid)
+        return self._atom_list
+
+    def _sorted_bonds(self):
+        if self._bond_list is None:
+            if self._bonds is None:
+                self._setup_bonds()
+            self._bond_list = sorted(self._bonds.values(), key=lambda x: (x.aid1, x.aid2))
+        return self._bond_list
 
     @property
     def atoms(self):
         """List of :class:`Atoms <pubchempy.Atom>` in this Compound."""
-        return sorted(self._atoms.values(), key=lambda x: x.aid)
+        return list(self._sorted_atoms())
 
     @property
     def bonds(self):
         """List of :class:`Bonds <pubchempy.Bond>` between :class:`Atoms <pubchempy.Atom>` in this Compound."""
-        return sorted(self._bonds.values(), key=lambda x: (x.aid1, x.aid2))
+        return list(self._sorted_bonds())
+
+    def atom(self, aid):
+        """Return the :class:`~pubchempy.Atom` with the given atom ID.
+
+        :param int aid: Atom ID.
+        :raises KeyError: If there is no atom with that ID.
+        """
+        if self._atoms is None:
+            self._setup_atoms()
+        return self._atoms[aid]
+
+    def bond(self, aid1, aid2):
+        """Return the :class:`~pubchempy.Bond` between the atoms with the given IDs, in either order.
+
+        :param int aid1: ID of one atom in the bond.
+        :param int aid2: ID of the other atom in the bond.
+        :raises KeyError: If there is no bond between those atoms.
+        """
+        if self._bonds is None:
+            self._setup_bonds()
+        return self._bonds[frozenset((aid1, aid2))]
+
+    def _atom_order(self, aids):
+        """Return the indices that sort the given atom IDs, to align arrays with :attr:`atoms`."""
+        import numpy as np
+        return np.argsort(np.asarray(aids), kind='stable')
+
+    @property
+    def atomic_numbers(self):
+        """NumPy array of the atomic numbers of the atoms in this Compound, in the same order as :attr:`atoms`.
+
+        Built directly from the record without creating :class:`~pubchempy.Atom` objects. Requires NumPy.
+        """
+        import numpy as np
+        aids = self.record['atoms']['aid']
+        elements = self.record['atoms']['element']
+        if not len(aids) == len(elements):
+            raise ResponseParseError('Error parsing atom elements')
+        return np.asarray(elements, dtype=np.int64)[self._atom_order(aids)]
+
+    @property
+    def charges(self):
+        """NumPy array of the formal charges on the atoms in this Compound, in the same order as :attr:`atoms`.
+
+        Requires NumPy.
+        """
+        import numpy as np
+        aids = np.sort(np.asarray(self.record['atoms']['aid']))
+        charges = np.zeros(len(aids), dtype=np.int64)
+        if 'charge' in self.record['atoms']:
+            charged = [c['aid'] for c in self.record['atoms']['charge']]
+            charges[np.searchsorted(aids, charged)] = [c['value'] for c in self.record['atoms']['charge']]
+        return charges
+
+    @property
+    def coords(self):
+        """NumPy array of atom coordinates with shape ``(n_atoms, 2)`` or ``(n_atoms, 3)``, in the same order as
+        :attr:`atoms`, or ``None`` if the record has no coordinates.
+
+        Built directly from the first conformer in the record without creating :class:`~pubchempy.Atom` objects, for
+        vectorised geometry such as ``c.coords.mean(axis=0)``. Requires NumPy.
+        """
+        if 'coords' not in self.record:
+            return None
+        import numpy as np
+        coords = self.record['coords'][0]
+        conformer = coords['conformers'][0]
+        columns = [conformer['x'], conformer['y']]
+        if conformer.get('z'):
+            columns.append(conformer['z'])
+        if not all(len(column) == len(coords['aid']) for column in columns):
+            raise ResponseParseError('Error parsing atom coordinates')
+        return np.array(columns, dtype=np.float64).T[self._atom_order(coords['aid'])]
 
     @memoized_property
     def synonyms(self):
@@ -331,83 +492,83 @@ class Compound(object):
     @property
     def molecular_formula(self):
         """Molecular formula."""
-        return _parse_prop({'label': 'Molecular Formula'}, self.record['props'])
+        return self._parse_prop({'label': 'Molecular Formula'}, self.record['props'])
 
     @property
     def molecular_weight(self):
         """Molecular Weight."""
-        return _parse_prop({'label': 'Molecular Weight'}, self.record['props'])
+        return self._parse_prop({'label': 'Molecular Weight'}, self.record['props'])
 
     @property
     def canonical_smiles(self):
         """Canonical SMILES, with no stereochemistry information."""
-        return _parse_prop({'label': 'SMILES', 'name': 'Canonical'}, self.record['props'])
+        return self._parse_prop({'label': 'SMILES', 'name': 'Canonical'}, self.record['props'])
 
     @property
     def isomeric_smiles(self):
         """Isomeric SMILES."""
-        return _parse_prop({'label': 'SMILES', 'name': 'Isomeric'}, self.record['props'])
+        return self._parse_prop({'label': 'SMILES', 'name': 'Isomeric'}, self.record['props'])
 
     @property
     def inchi(self):
         """InChI string."""
-        return _parse_prop({'label': 'InChI', 'name': 'Standard'}, self.record['props'])
+        return self._parse_prop({'label': 'InChI', 'name': 'Standard'}, self.record['props'])
 
     @property
     def inchikey(self):
         """InChIKey."""
-        return _parse_prop({'label': 'InChIKey', 'name': 'Standard'}, self.record['props'])
+        return self._parse_prop({'label': 'InChIKey', 'name': 'Standard'}, self.record['props'])
 
     @property
     def iupac_name(self):
         """Preferred IUPAC name."""
         # Note: Allowed, CAS-like Style, Preferred, Systematic, Traditional are available in full record
-        return _parse_prop({'label': 'IUPAC Name', 'name': 'Preferred'}, self.record['props'])
+        return self._parse_prop({'label': 'IUPAC Name', 'name': 'Preferred'}, self.record['props'])
 
     @property
     def xlogp(self):
         """XLogP."""
-        return _parse_prop({'label': 'Log P'}, self.record['props'])
+        return self._parse_prop({'label': 'Log P'}, self.record['props'])
 
     @property
     def exact_mass(self):
         """Exact mass."""
-        return _parse_prop({'label': 'Mass', 'name': 'Exact'}, self.record['props'])
+        return self._parse_prop({'label': 'Mass', 'name': 'Exact'}, self.record['props'])
 
     @property
     def monoisotopic_mass(self):
         """Monoisotopic mass."""
-        return _parse_prop({'label': 'Weight', 'name': 'MonoIsotopic'}, self.record['props'])
+        return self._parse_prop({'label': 'Weight', 'name': 'MonoIsotopic'}, self.record['props'])
 
     @property
     def tpsa(self):
         """Topological Polar Surface Area."""
-        return _parse_prop({'implementation': 'E_TPSA'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_TPSA'}, self.record['props'])
 
     @property
     def complexity(self):
         """Complexity."""
-        return _parse_prop({'implementation': 'E_COMPLEXITY'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_COMPLEXITY'}, self.record['props'])
 
     @property
     def h_bond_donor_count(self):
         """Hydrogen bond donor count."""
-        return _parse_prop({'implementation': 'E_NHDONORS'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_NHDONORS'}, self.record['props'])
 
     @property
     def h_bond_acceptor_count(self):
         """Hydrogen bond acceptor count."""
-        return _parse_prop({'implementation': 'E_NHACCEPTORS'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_NHACCEPTORS'}, self.record['props'])
 
     @property
     def rotatable_bond_count(self):
         """Rotatable bond count."""
-        return _parse_prop({'implementation': 'E_NROTBONDS'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_NROTBONDS'}, self.record['props'])
 
     @property
     def fingerprint(self):
         """Raw padded and hex-encoded fingerprint, as returned by the PUG REST API."""
-        return _parse_prop({'implementation': 'E_SCREEN'}, self.record['props'])
+        return self._parse_prop({'implementation': 'E_SCREEN'}, self.record['props'])
 
     @property
     def cactvs_fingerprint(self):
@@ -478,61 +639,61 @@ class Compound(object):
     def volume_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Shape', 'name': 'Volume'}, conf['data'])
+            return self._parse_prop({'label': 'Shape', 'name': 'Volume'}, conf['data'])
 
     @property
     def multipoles_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Shape', 'name': 'Multipoles'}, conf['data'])
+            return self._parse_prop({'label': 'Shape', 'name': 'Multipoles'}, conf['data'])
 
     @property
     def conformer_rmsd_3d(self):
         coords = self.record['coords'][0]
         if 'data' in coords:
-            return _parse_prop({'label': 'Conformer', 'name': 'RMSD'}, coords['data'])
+            return self._parse_prop({'label': 'Conformer', 'name': 'RMSD'}, coords['data'])
 
     @property
     def effective_rotor_count_3d(self):
-        return _parse_prop({'label': 'Count', 'name': 'Effective Rotor'}, self.record['props'])
+        return self._parse_prop({'label': 'Count', 'name': 'Effective Rotor'}, self.record['props'])
 
     @property
     def pharmacophore_features_3d(self):
-        return _parse_prop({'label': 'Features', 'name': 'Pharmacophore'}, self.record['props'])
+        return self._parse_prop({'label': 'Features', 'name': 'Pharmacophore'}, self.record['props'])
 
     @property
     def mmff94_partial_charges_3d(self):
-        return _parse_prop({'label': 'Charge', 'name': 'MMFF94 Partial'}, self.record['props'])
+        return self._parse_prop({'label': 'Charge', 'name': 'MMFF94 Partial'}, self.record['props'])
 
     @property
     def mmff94_energy_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Energy', 'name': 'MMFF94 NoEstat'}, conf['data'])
+            return self._parse_prop({'label': 'Energy', 'name': 'MMFF94 NoEstat'}, conf['data'])
 
     @property
     def conformer_id_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Conformer', 'name': 'ID'}, conf['data'])
+            return self._parse_prop({'label': 'Conformer', 'name': 'ID'}, conf['data'])
 
     @property
     def shape_selfoverlap_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Shape', 'name': 'Self Overlap'}, conf['data'])
+            return self._parse_prop({'label': 'Shape', 'name': 'Self Overlap'}, conf['data'])
 
     @property
     def feature_selfoverlap_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Feature', 'name': 'Self Overlap'}, conf['data'])
+            return self._parse_prop({'label': 'Feature', 'name': 'Self Overlap'}, conf['data'])
 
     @property
     def shape_fingerprint_3d(self):
         conf = self.record['coords'][0]['conformers'][0]
         if 'data' in conf:
-            return _parse_prop({'label': 'Fingerprint', 'name': 'Shape'}, conf['data'])
+            return self._parse_prop({'label': 'Fingerprint', 'name': 'Shape'}, conf['data'])
 
     @property
     def safety_data(self):
@@ -546,7 +707,8 @@ class Compound(object):
 
 
 
-def get_compounds(identifier, namespace='cid', searchtype=None, as_dataframe=False, **kwargs):
+@with_deadline
+def get_compounds(identifier, namespace='cid', searchtype=None, as_dataframe=False, errors='raise', **kwargs):
     """Retrieve the specified compound records from PubChem.
 
     :param identifier: The compound identifier to use as a search query.
@@ -554,11 +716,18 @@ def get_compounds(identifier, namespace='cid', searchtype=None, as_dataframe=Fal
     :param searchtype: (optional) The advanced search type, one of substructure, superstructure or similarity.
     :param as_dataframe: (optional) Automatically extract the :class:`~pubchempy.Compound` properties into a pandas
                          :class:`~pandas.DataFrame` and return that.
+    :param errors: (optional) Set to ``'collect'`` to isolate identifiers that cause a
+                   :class:`~pubchempy.BadRequestError` or :class:`~pubchempy.NotFoundError` instead of failing the
+                   whole request. A :class:`~pubchempy.batch.BatchResult` is returned, with the bad identifiers in its
+                   ``failures`` attribute.
     """
-    results = get_json(identifier, namespace, searchtype=searchtype, **kwargs)
+    failures = _collect_failures(errors)
+    results = get_json_chunked(identifier, namespace, searchtype=searchtype, failures=failures, **kwargs)
     compounds = [Compound(r) for r in results['PC_Compounds']] if results else []
     if as_dataframe:
         return compounds_to_frame(compounds)
+    if failures is not None:
+        return BatchResult(compounds, failures)
     return compounds
 
 def compounds_to_frame(compounds, properties=None):
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Overall time budgets for high-level calls.
+
+A deadline set with :func:`deadline` applies to everything done inside it: each request attempt, waits for the rate
+limiter, backoff between retries, polling of asynchronous searches and chunked sub-requests running in other threads.
+Socket timeouts are shortened to fit the time remaining, and :class:`~pubchempy.errors.DeadlineExceededError` is raised
+as soon as the budget runs out, so a call never takes much longer than its deadline however the time is spent.
+"""
+
+import contextlib
+import contextvars
+import time
+
+from .errors import DeadlineExceededError
+
+_deadline = contextvars.ContextVar('pubchempy_deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Context manager that limits everything inside it to ``seconds`` in total.
+
+    Nested deadlines can only shorten the time available, never extend it.
+
+    Usage::
+
+        with deadline(10):
+            compounds = get_compounds(cids)
+            properties = get_properties('XLogP', cids)
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Return the number of seconds left before the current deadline, or ``None`` if there is no deadline."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def check_deadline(description='Request'):
+    """Raise :class:`~pubchempy.errors.DeadlineExceededError` if the current deadline has passed.
+
+    Returns the number of seconds remaining, or ``None`` if there is no deadline.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError('%s did not complete within its deadline' % description)
+    return left
+
+
+def limit_timeout(timeout):
+    """Return ``timeout`` shortened to fit within the current deadline."""
+    left = check_deadline()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
@@ -1,6 +1,7 @@
 import functools
 import warnings
 from .errors import PubChemPyDeprecationWarning
+from .deadlines import deadline as deadline_context
 
 
 def memoized_property(fget):
@@ -31,4 +32,19 @@ def deprecated(message=None):
             )
             return func(*args, **kwargs)
         return wrapped
-    return deco
\ No newline at end of file
+    return deco
+
+
+def with_deadline(func):
+    """Decorator that adds a ``deadline`` keyword argument, limiting the total time in seconds a call may take.
+
+    See :func:`~pubchempy.deadlines.deadline`.
+    """
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        seconds = kwargs.pop('deadline', None)
+        if seconds is None:
+            return func(*args, **kwargs)
+        with deadline_context(seconds):
+            return func(*args, **kwargs)
+    return wrapped
@@ -15,6 +15,16 @@ class ResponseParseError(PubChemPyError):
     pass
 
 
+class DeadlineExceededError(PubChemPyError):
+    """A call did not complete within the deadline it was given."""
+    pass
+
+
+class CircuitOpenError(PubChemPyError):
+    """Request not sent because PubChem has been failing recently. See :class:`~pubchempy.CircuitBreaker`."""
+    pass
+
+
 class PubChemHTTPError(PubChemPyError):
     """Generic error class to handle all HTTP error codes."""
     def __init__(self, e):
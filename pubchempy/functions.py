@@ -1,4 +1,3 @@
-
 # -*- coding: utf-8 -*-
 """
 PubChemPy
@@ -7,6 +6,7 @@ Python interface for the PubChem PUG REST service.
 https://github.com/mcs07/PubChemPy
 """
 
+import asyncio
 import json
 import os
 import time
@@ -15,10 +15,15 @@ from .mapper import PROPERTY_MAP
 
 from urllib.error import HTTPError
 from urllib.parse import quote, urlencode
-from urllib.request import urlopen
-from .errors import PubChemHTTPError, NotFoundError
+from .errors import PubChemHTTPError, BadRequestError, DeadlineExceededError, NotFoundError
 import re
 from .logger import createLogger
+from .transport import get_session
+from .deadlines import remaining
+from .decorators import with_deadline
+from .batch import CHUNKABLE_NAMESPACES, BatchResult, get_batcher, get_micro_batcher, merge_json
+from .cache import NOT_FOUND, cached, get_cache, make_key
+from .singleflight import coalesce
 
 log = createLogger(__name__)
 
@@ -27,6 +32,13 @@ log = createLogger(__name__)
 API_BASE = 'https://pubchem.ncbi.nlm.nih.gov/rest/pug'
 API_VIEW = 'https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound'
 
+#: Delay in seconds before the first status check of an asynchronous listkey search.
+POLL_INTERVAL_MIN = 0.25
+#: Maximum delay in seconds between status checks of an asynchronous listkey search.
+POLL_INTERVAL_MAX = 5.0
+#: Factor the delay between status checks grows by after each check.
+POLL_BACKOFF = 1.5
+
 
 
 text_types = str, bytes
@@ -38,6 +50,20 @@ def request(identifier, namespace='cid', domain='compound', operation=None, outp
 
     Full specification at http://pubchem.ncbi.nlm.nih.gov/pug_rest/PUG_REST.html
     """
+    apiurl, postdata = build_request(identifier, namespace, domain, operation, output, searchtype, **kwargs)
+    # Make request
+    try:
+        # log.debug('Request URL: %s', apiurl)
+        # log.debug('Request data: %s', postdata)
+        response = get_session().request(apiurl, postdata)
+        return response
+    except HTTPError as e:
+        raise PubChemHTTPError(e)
+
+
+def build_request(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+                  **kwargs):
+    """Construct the API URL and POST data for a request from parameters."""
     if not identifier:
         raise ValueError('identifier/cid cannot be None')
     # If identifier is a list, join with commas into string
@@ -61,33 +87,179 @@ def request(identifier, namespace='cid', domain='compound', operation=None, outp
     apiurl = '/'.join(comps)
     if kwargs:
         apiurl += '?%s' % urlencode(kwargs)
-    # Make request
-    try:
-        # log.debug('Request URL: %s', apiurl)
-        # log.debug('Request data: %s', postdata)
-        response = urlopen(apiurl, postdata)
-        return response
-    except HTTPError as e:
-        raise PubChemHTTPError(e)
+    return apiurl, postdata
 
 
 def get(identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None, **kwargs):
-    """Request wrapper that automatically handles async requests."""
-    if (searchtype and searchtype != 'xref') or namespace in ['formula']:
+    """Request wrapper that automatically handles async requests.
+
+    If a cache has been installed with :func:`~pubchempy.cache.set_cache`, responses are looked up there first.
+    Identical requests made concurrently from several threads share a single request to PubChem.
+    """
+    def fetch():
+        if (searchtype and searchtype != 'xref') or namespace in ['formula']:
+            return ListKeyJob.submit(identifier, namespace, domain, operation, output, searchtype, **kwargs).wait()
+        cid = _single_cid(identifier, namespace, domain, operation, output, searchtype)
+        if cid is not None and get_micro_batcher() is not None:
+            return _get_micro_batched(cid, operation, **kwargs)
+        return request(identifier, namespace, domain, operation, output, searchtype, **kwargs).read()
+    key = make_key(identifier, namespace, domain, operation, output, searchtype, **kwargs)
+    # Listkeys are temporary, so never cache requests that use or return them
+    if namespace == 'listkey' or 'list_return' in kwargs:
+        return coalesce(key, fetch)
+    return cached(key, operation, fetch)
+
+
+def _single_cid(identifier, namespace, domain, operation, output, searchtype):
+    """Return the CID if a request is for the record or properties of a single compound, otherwise ``None``."""
+    if namespace != 'cid' or domain != 'compound' or output != 'JSON' or searchtype:
+        return None
+    if operation is not None and not operation.startswith('property/'):
+        return None
+    if isinstance(identifier, (list, tuple)) and len(identifier) == 1:
+        identifier = identifier[0]
+    if isinstance(identifier, bytes):
+        identifier = identifier.decode()
+    identifier = str(identifier).strip()
+    return identifier if identifier.isdigit() else None
+
+
+def _get_micro_batched(cid, operation=None, **kwargs):
+    """Retrieve a single compound record or property row as part of a batch with other concurrent lookups."""
+    def fetch(cids):
+        try:
+            results = json.loads(request(cids, 'cid', 'compound', operation, 'JSON', **kwargs).read().decode())
+        except NotFoundError:
+            return {}
+        if operation is None:
+            return dict((str(r['id']['id']['cid']), {'PC_Compounds': [r]}) for r in results['PC_Compounds'])
+        return dict((str(r['CID']), {'PropertyTable': {'Properties': [r]}})
+                    for r in results['PropertyTable']['Properties'])
+    key = (operation, tuple(sorted((k, str(v)) for k, v in kwargs.items() if v is not None)))
+    result = get_micro_batcher().call(key, cid, fetch)
+    if result is None:
+        raise NotFoundError('No results found for CID %s' % cid)
+    return json.dumps(result).encode()
+
+
+class ListKeyJob(object):
+    """Handle for an asynchronous PubChem search that is identified by a listkey while it runs on the server.
+
+    Searches by formula or a searchtype such as substructure or similarity run asynchronously on the PubChem servers.
+    Submitting them returns a listkey straight away, and the status is then polled until the results are ready.
+    Polling starts quickly and backs off as the search takes longer. Submit many searches before waiting on any of
+    them so they run on the server at the same time::
+
+        jobs = [ListKeyJob.submit(smiles, 'smiles', operation='cids', searchtype='substructure') for smiles in queries]
+        results = wait_all(jobs)
+
+    Jobs can also be awaited in a coroutine.
+    """
+
+    def __init__(self, listkey, domain='compound', operation=None, output='JSON', **kwargs):
+        """Initialize with the listkey of a running search.
+
+        :param str listkey: The listkey returned when the search was submitted.
+        :param domain: (optional) The search domain.
+        :param operation: (optional) The operation to perform on the search results.
+        :param output: (optional) The output format of the results.
+        """
+        self.listkey = listkey
+        self.domain = domain
+        self.operation = operation
+        self.output = output
+        self.kwargs = kwargs
+        self._response = None
+        self._interval = POLL_INTERVAL_MIN
+        self._next_poll = time.monotonic() + self._interval
+
+    @classmethod
+    def submit(cls, identifier, namespace='cid', domain='compound', operation=None, output='JSON', searchtype=None,
+               **kwargs):
+        """Submit a search and return a :class:`ListKeyJob` without waiting for it to finish."""
         response = request(identifier, namespace, domain, None, 'JSON', searchtype, **kwargs).read()
         status = json.loads(response.decode())
         if 'Waiting' in status and 'ListKey' in status['Waiting']:
-            identifier = status['Waiting']['ListKey']
-            namespace = 'listkey'
-            while 'Waiting' in status and 'ListKey' in status['Waiting']:
-                time.sleep(2)
-                response = request(identifier, namespace, domain, operation, 'JSON', **kwargs).read()
-                status = json.loads(response.decode())
-            if not output == 'JSON':
-                response = request(identifier, namespace, domain, operation, output, searchtype, **kwargs).read()
-    else:
-        response = request(identifier, namespace, domain, operation, output, searchtype, **kwargs).read()
-    return response
+            return cls(status['Waiting']['ListKey'], domain, operation, output, **kwargs)
+        # Results were returned immediately
+        job = cls(None, domain, operation, output, **kwargs)
+        job._response = response
+        return job
+
+    def __repr__(self):
+        return 'ListKeyJob(%s)' % self.listkey
+
+    def __await__(self):
+        return self.wait_async().__await__()
+
+    def done(self):
+        """Whether the search has finished and the results are available, without making a request."""
+        return self._response is not None
+
+    def poll(self):
+        """Check the status of the search on the server. Return ``True`` if it has finished."""
+        if self.done():
+            return True
+        response = request(self.listkey, 'listkey', self.domain, self.operation, 'JSON', **self.kwargs).read()
+        status = json.loads(response.decode())
+        if 'Waiting' in status and 'ListKey' in status['Waiting']:
+            self._interval = min(POLL_INTERVAL_MAX, self._interval * POLL_BACKOFF)
+            self._next_poll = time.monotonic() + self._interval
+            return False
+        if not self.output == 'JSON':
+            response = request(self.listkey, 'listkey', self.domain, self.operation, self.output,
+                               **self.kwargs).read()
+        self._response = response
+        return True
+
+    def delay(self):
+        """Seconds until the search status should next be checked."""
+        return 0 if self.done() else max(0, self._next_poll - time.monotonic())
+
+    def result(self):
+        """Return the raw response for a finished search."""
+        if not self.done():
+            raise ValueError('Search has not finished yet')
+        return self._response
+
+    def wait(self, timeout=None):
+        """Block until the search has finished and return the raw response.
+
+        :param float timeout: (optional) Maximum number of seconds to wait.
+        """
+        return wait_all([self], timeout)[0]
+
+    async def wait_async(self):
+        """Wait for the search to finish without blocking the event loop and return the raw response."""
+        loop = asyncio.get_running_loop()
+        while not self.done():
+            await asyncio.sleep(self.delay())
+            await loop.run_in_executor(None, self.poll)
+        return self._response
+
+
+def wait_all(jobs, timeout=None):
+    """Wait for a number of :class:`ListKeyJob` searches to finish and return their raw responses.
+
+    Each job is polled on its own schedule, so searches that finish quickly are not held up by slow ones. Raises
+    :class:`~pubchempy.errors.DeadlineExceededError` if the searches don't finish within ``timeout`` seconds.
+
+    :param float timeout: (optional) Maximum number of seconds to wait.
+    """
+    expires = None if timeout is None else time.monotonic() + timeout
+    pending = [job for job in jobs if not job.done()]
+    while pending:
+        job = min(pending, key=lambda j: j.delay())
+        delay = job.delay()
+        if expires is not None and time.monotonic() + delay > expires:
+            raise DeadlineExceededError('Search did not finish within %s seconds' % timeout)
+        left = remaining()
+        if left is not None and delay > left:
+            raise DeadlineExceededError('Search did not finish within its deadline')
+        time.sleep(delay)
+        if job.poll():
+            pending.remove(job)
+    return [job.result() for job in jobs]
 
 
 def get_json(identifier, namespace='cid', domain='compound', operation=None, searchtype=None, **kwargs):
@@ -98,6 +270,41 @@ def get_json(identifier, namespace='cid', domain='compound', operation=None, sea
         log.info(e)
         return None
 
+def get_json_chunked(identifier, namespace='cid', domain='compound', operation=None, searchtype=None, failures=None,
+                     **kwargs):
+    """Like :func:`get_json`, but splits long lists of identifiers into chunks that are requested concurrently.
+
+    Results for each chunk are merged back into a single response in input order. The chunk size is tuned separately
+    for each combination of domain, operation and record type.
+
+    If a list is given as ``failures``, chunks that fail because of bad identifiers are bisected to isolate them, and
+    the bad identifiers are appended to the list as ``(identifier, error)`` pairs instead of raising.
+    """
+    if searchtype or namespace not in CHUNKABLE_NAMESPACES or isinstance(identifier, text_types + (int,)):
+        if failures is None:
+            return get_json(identifier, namespace, domain, operation, searchtype, **kwargs)
+        try:
+            return json.loads(get(identifier, namespace, domain, operation, 'JSON', searchtype, **kwargs).decode())
+        except (BadRequestError, NotFoundError) as e:
+            log.warning('Failed to retrieve %s: %s', identifier, e)
+            failures.append((identifier, e))
+            return None
+    if failures is None:
+        fetch = lambda chunk: get_json(chunk, namespace, domain, operation, **kwargs)
+    else:
+        fetch = lambda chunk: json.loads(get(chunk, namespace, domain, operation, 'JSON', **kwargs).decode())
+    key = (domain, operation, kwargs.get('record_type'))
+    return merge_json(get_batcher().map(fetch, identifier, key, failures))
+
+
+def _collect_failures(errors):
+    """Return a list to collect failures in for the given ``errors`` mode, or ``None`` to raise them."""
+    if errors not in {'raise', 'collect'}:
+        raise ValueError("errors must be 'raise' or 'collect'")
+    return [] if errors == 'collect' else None
+
+
+@with_deadline
 def get_sdf(identifier, namespace='cid', domain='compound',operation=None, searchtype=None, **kwargs):
     """Request wrapper that automatically parses SDF response and supresses NotFoundError."""
     try:
@@ -107,31 +314,106 @@ def get_sdf(identifier, namespace='cid', domain='compound',operation=None, searc
         return None
 
 
-def get_properties(properties, identifier, namespace='cid', searchtype=None, as_dataframe=False, **kwargs):
+@with_deadline
+def get_properties(properties, identifier, namespace='cid', searchtype=None, as_dataframe=False, errors='raise',
+                   **kwargs):
     """Retrieve the specified properties from PubChem.
 
     :param identifier: The compound, substance or assay identifier to use as a search query.
     :param namespace: (optional) The identifier type.
     :param searchtype: (optional) The advanced search type, one of substructure, superstructure or similarity.
     :param as_dataframe: (optional) Automatically extract the properties into a pandas :class:`~pandas.DataFrame`.
+    :param errors: (optional) Set to ``'collect'`` to isolate identifiers that cause a
+                   :class:`~pubchempy.BadRequestError` or :class:`~pubchempy.NotFoundError` instead of failing the
+                   whole request. A :class:`~pubchempy.batch.BatchResult` is returned, with the bad identifiers in its
+                   ``failures`` attribute.
     """
+    failures = _collect_failures(errors)
     if isinstance(properties, text_types):
         properties = properties.split(',')
-    properties = ','.join([PROPERTY_MAP.get(p, p) for p in properties])
-    properties = 'property/%s' % properties
-    results = get_json(identifier, namespace, 'compound', properties, searchtype=searchtype, **kwargs)
-    results = results['PropertyTable']['Properties'] if results else []
+    properties = [PROPERTY_MAP.get(p, p) for p in properties]
+    if get_cache() is not None and namespace == 'cid' and not searchtype and not kwargs:
+        results = _get_cached_properties(properties, identifier, failures)
+    else:
+        results = get_json_chunked(identifier, namespace, 'compound', 'property/%s' % ','.join(properties),
+                                   searchtype=searchtype, failures=failures, **kwargs)
+        results = results['PropertyTable']['Properties'] if results else []
     if as_dataframe:
         import pandas as pd
         return pd.DataFrame.from_records(results, index='CID')
+    if failures is not None:
+        return BatchResult(results, failures)
     return results
 
 
+def _property_key(cid, tag=None):
+    """Return the cache key for a single property value of a single CID, or for the CID itself if no tag is given."""
+    return make_key(cid, 'cid', 'compound', 'property/%s' % tag if tag else 'property', 'value')
+
+
+def _get_cached_properties(tags, identifier, failures=None):
+    """Retrieve property rows for a list of CIDs, caching each (CID, property) value separately.
+
+    Only the properties that aren't already cached are requested, and only for the CIDs missing them. CIDs that are
+    missing the same properties are requested together. Properties that PubChem doesn't have for a CID are cached as
+    missing so they aren't requested again, and CIDs that aren't found at all are remembered for the cache's
+    ``negative_ttl``. CIDs that aren't found are added to ``failures``, if given, whether or not they were cached.
+    """
+    cache = get_cache()
+    if isinstance(identifier, text_types):
+        identifier = identifier.decode() if isinstance(identifier, bytes) else identifier
+        identifier = identifier.split(',')
+    elif isinstance(identifier, int):
+        identifier = [identifier]
+    cids = [str(cid).strip() for cid in identifier]
+    values = {}
+    missing = {}
+    for cid in dict.fromkeys(cids):
+        if cache.get(_property_key(cid)) is NOT_FOUND:
+            if failures is not None:
+                failures.append((cid, NotFoundError('No results found for CID %s' % cid)))
+            continue
+        for tag in tags:
+            value = cache.get(_property_key(cid, tag))
+            if value is None:
+                missing.setdefault(cid, []).append(tag)
+            else:
+                values.setdefault(cid, {})[tag] = json.loads(value.decode())
+    groups = {}
+    for cid, missing_tags in missing.items():
+        groups.setdefault(tuple(missing_tags), []).append(cid)
+    for missing_tags, group in groups.items():
+        log.debug('Requesting %s uncached properties for %s CIDs', len(missing_tags), len(group))
+        failed = len(failures) if failures is not None else 0
+        results = get_json_chunked(group, 'cid', 'compound', 'property/%s' % ','.join(missing_tags),
+                                   failures=failures)
+        for row in results['PropertyTable']['Properties'] if results else []:
+            cid = str(row['CID'])
+            for tag in missing_tags:
+                cache.put(_property_key(cid, tag), json.dumps(row.get(tag)).encode(), 'property')
+                values.setdefault(cid, {})[tag] = row.get(tag)
+        failed = set(str(identifier) for identifier, _ in failures[failed:]) if failures is not None else set()
+        for cid in group:
+            if cid not in values and cid not in failed:
+                cache.put_not_found(_property_key(cid))
+                if failures is not None:
+                    failures.append((cid, NotFoundError('No results found for CID %s' % cid)))
+    rows = []
+    for cid in cids:
+        if cid in values:
+            row = {'CID': int(cid)}
+            row.update((tag, values[cid][tag]) for tag in tags if values[cid].get(tag) is not None)
+            rows.append(row)
+    return rows
+
+
+@with_deadline
 def get_synonyms(identifier, namespace='cid', domain='compound', searchtype=None, **kwargs):
-    results = get_json(identifier, namespace, domain, 'synonyms', searchtype=searchtype, **kwargs)
+    results = get_json_chunked(identifier, namespace, domain, 'synonyms', searchtype=searchtype, **kwargs)
     return results['InformationList']['Information'] if results else []
 
 
+@with_deadline
 def get_cids(identifier, namespace='name', domain='compound', searchtype=None, **kwargs):
     results = get_json(identifier, namespace, domain, 'cids', searchtype=searchtype, **kwargs)
     if not results:
@@ -142,8 +424,9 @@ def get_cids(identifier, namespace='name', domain='compound', searchtype=None, *
         return results['InformationList']['Information']
 
 
+@with_deadline
 def get_sids(identifier, namespace='cid', domain='compound', searchtype=None, **kwargs):
-    results = get_json(identifier, namespace, domain, 'sids', searchtype=searchtype, **kwargs)
+    results = get_json_chunked(identifier, namespace, domain, 'sids', searchtype=searchtype, **kwargs)
     if not results:
         return []
     elif 'IdentifierList' in results:
@@ -152,8 +435,9 @@ def get_sids(identifier, namespace='cid', domain='compound', searchtype=None, **
         return results['InformationList']['Information']
 
 
+@with_deadline
 def get_aids(identifier, namespace='cid', domain='compound', searchtype=None, **kwargs):
-    results = get_json(identifier, namespace, domain, 'aids', searchtype=searchtype, **kwargs)
+    results = get_json_chunked(identifier, namespace, domain, 'aids', searchtype=searchtype, **kwargs)
     if not results:
         return []
     elif 'IdentifierList' in results:
@@ -168,6 +452,7 @@ def get_all_sources(domain='substance'):
     return results['InformationList']['SourceName']
 
 
+@with_deadline
 def download(outformat, path, identifier, namespace='cid', domain='compound', operation=None, searchtype=None,
              overwrite=False, **kwargs):
     """Format can be  XML, ASNT/B, JSON, SDF, CSV, PNG, TXT."""
@@ -185,18 +470,46 @@ def _parse_prop(search, proplist):
         return props[0]['value'][list(props[0]['value'].keys())[0]]
 
 
+#: Combinations of urn fields that property lookups search by, and so are included in a props index.
+PROP_INDEX_FIELDS = {('label',), ('label', 'name'), ('implementation',)}
+
+
+def _prop_key(search):
+    return tuple(sorted(search.items()))
+
+
+def _index_props(proplist):
+    """Build an index of property values in a record, for looking up with :func:`_prop_key` search filters.
+
+    Gives the same value as :func:`_parse_prop` would, i.e. the first property that matches the filter.
+    """
+    index = {}
+    for prop in proplist:
+        urn = prop['urn']
+        value = prop['value'][list(prop['value'].keys())[0]]
+        for fields in PROP_INDEX_FIELDS:
+            if all(field in urn for field in fields):
+                index.setdefault(tuple((field, urn[field]) for field in fields), value)
+    return index
+
+
+@with_deadline
 def request_SDS(cid):
     if not cid:
         raise ValueError('identifier/cid cannot be None')
-    # Make request
-    try:
-        log.debug('Request URL: %s', API_VIEW)
-        log.debug('Request data: %s', cid)
-        response = urlopen(API_VIEW + '/{}/JSON?heading=safety+and+hazards'.format(cid))
-        return _parse_sds(json.loads(response.read().decode()))
-    except HTTPError as e:
-        log.info(e)
-        raise PubChemHTTPError(e)
+    url = API_VIEW + '/{}/JSON?heading=safety+and+hazards'.format(cid)
+
+    def fetch():
+        # Make request
+        try:
+            log.debug('Request URL: %s', API_VIEW)
+            log.debug('Request data: %s', cid)
+            return get_session().request(url).read()
+        except HTTPError as e:
+            log.info(e)
+            raise PubChemHTTPError(e)
+    response = cached(make_key(cid, 'cid', 'pug_view', 'sds'), 'sds', fetch)
+    return _parse_sds(json.loads(response.decode()))
 
 
 def _parse_sds(result):
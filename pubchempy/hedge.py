@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Hedged requests to cut tail latency.
+
+Most PubChem responses arrive quickly, but the occasional one takes several seconds. With hedging enabled, if a
+response hasn't arrived by the time most responses normally have, :class:`Hedge` sends a duplicate request and uses
+whichever response arrives first. All PubChem requests are read-only, so duplicates are safe.
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+
+from .logger import createLogger
+
+log = createLogger(__name__)
+
+
+class Hedge(object):
+    """Hedging policy that sends a duplicate request when a response is slower than usual.
+
+    The delay before hedging is the ``percentile`` of recent response times, so it adapts to how quickly the server is
+    currently responding. Duplicate requests go through the rate limiter like any other, so hedging never exceeds the
+    PubChem usage policy. Response times are measured from when a request is actually sent, so time spent waiting for
+    the rate limiter or for a free connection never counts as server latency.
+
+    :param float percentile: (optional) Percentile of recent response times after which a duplicate is sent.
+    :param float initial_delay: (optional) Delay in seconds used until enough response times have been recorded.
+    :param float min_delay: (optional) Shortest delay in seconds before sending a duplicate.
+    :param float max_delay: (optional) Longest delay in seconds before sending a duplicate.
+    :param int max_hedges: (optional) Maximum number of duplicates sent for each request.
+    :param int window: (optional) Number of recent response times the delay is calculated from.
+    """
+
+    def __init__(self, percentile=95, initial_delay=1.0, min_delay=0.05, max_delay=10.0, max_hedges=1, window=200):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_hedges = max_hedges
+        self.hedged = 0
+        """Number of duplicate requests sent."""
+        self.wins = 0
+        """Number of requests answered by a duplicate rather than the original."""
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __repr__(self):
+        return 'Hedge(percentile=%s, max_hedges=%s)' % (self.percentile, self.max_hedges)
+
+    def delay(self):
+        """Return the number of seconds to wait for a response before sending a duplicate."""
+        with self._lock:
+            if len(self._latencies) < 20:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))
+        return max(self.min_delay, min(self.max_delay, latencies[index]))
+
+    def _observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _submit(self, func, prepare=None):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='pubchempy-hedge')
+        attempt = _Attempt()
+
+        def timed():
+            _attempt.set(attempt)
+            if prepare is not None and not attempt.cancelled:
+                prepare()
+            if attempt.cancelled:
+                raise CancelledError()
+            attempt.sent = time.monotonic()
+            result = func()
+            return result, time.monotonic() - attempt.sent
+        # Run in a copy of the caller's context so any deadline applies to the duplicate too
+        attempt.future = self._executor.submit(contextvars.copy_context().run, timed)
+        return attempt
+
+    def call(self, func, description='', prepare=None):
+        """Call ``func`` with no arguments, calling it again in parallel if it is slow, and return the first result.
+
+        If every attempt fails, the error from the first attempt to finish is raised. Once one attempt succeeds, any
+        duplicates that haven't been sent yet are cancelled.
+
+        :param func: Function that sends the request and returns the response.
+        :param str description: (optional) Description of the request used in log messages.
+        :param prepare: (optional) Function called before each duplicate is sent, e.g. to wait for the rate limiter.
+                        Time spent in it does not count towards the response time.
+        """
+        attempts = [self._submit(func)]
+        futures = [attempts[0].future]
+        pending = set(futures)
+        error = None
+        while pending:
+            timeout = None
+            if len(attempts) <= self.max_hedges:
+                delay = self.delay()
+                sent = attempts[-1].sent
+                # Until the latest attempt is actually sent, check again shortly rather than starting the clock
+                timeout = min(delay, self.min_delay) if sent is None else max(0.0, sent + delay - time.monotonic())
+            done, pending = wait(pending, timeout, FIRST_COMPLETED)
+            for future in sorted(done, key=futures.index):
+                try:
+                    result, latency = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                self._observe(latency)
+                if future is not futures[0]:
+                    with self._lock:
+                        self.wins += 1
+                for attempt in attempts:
+                    attempt.cancel()
+                return result
+            sent = attempts[-1].sent
+            if not done and timeout is not None and sent is not None and time.monotonic() - sent >= delay:
+                log.debug('No response for %s after %.2fs, sending duplicate request', description, delay)
+                with self._lock:
+                    self.hedged += 1
+                attempts.append(self._submit(func, prepare))
+                futures.append(attempts[-1].future)
+                pending.add(futures[-1])
+        raise error
+
+
+class _Attempt(object):
+    """A single attempt at a hedged request, and when it was sent."""
+
+    def __init__(self):
+        self.sent = None
+        self.cancelled = False
+        self.future = None
+
+    def cancel(self):
+        """Stop the attempt being sent, if it hasn't been already."""
+        self.cancelled = True
+        self.future.cancel()
+
+
+_attempt = contextvars.ContextVar('pubchempy_hedge_attempt', default=None)
+
+
+@contextlib.contextmanager
+def paused():
+    """Context manager that stops the clock of the current hedged attempt while waiting for a local resource.
+
+    The transport uses this while waiting for a free connection, so a full connection pool isn't mistaken for a slow
+    server. The clock restarts from zero once the wait is over. Does nothing outside a hedged request.
+    """
+    attempt = _attempt.get()
+    if attempt is not None:
+        attempt.sent = None
+    try:
+        yield
+    finally:
+        if attempt is not None:
+            attempt.sent = time.monotonic()
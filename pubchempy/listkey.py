@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable listkeys for running several operations on the results of one search.
+
+PubChem can store the results of a search on its servers and return a listkey that refers to them. Any operation can
+then be performed on the stored results, so fetching CIDs, properties and synonyms for the same substructure search
+only runs the search once. Large result sets can be streamed a page at a time with the ``iter_*`` functions.
+"""
+
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .compound import Compound
+from .errors import BadRequestError, NotFoundError
+from .functions import get, get_json, text_types
+from .logger import createLogger
+from .mapper import PROPERTY_MAP
+
+log = createLogger(__name__)
+
+
+#: The operation that lists the identifiers of records in each domain.
+IDENTIFIER_OPERATIONS = {'compound': 'cids', 'substance': 'sids', 'assay': 'aids'}
+
+#: Default number of results retrieved in each page when iterating.
+PAGE_SIZE = 1000
+
+
+class ListKey(object):
+    """Search results stored on the PubChem servers, which further requests can be made against.
+
+    Usage::
+
+        lk = ListKey.search('C1=CC=CC=C1', 'smiles', searchtype='substructure', MaxRecords=100)
+        cids = lk.cids()
+        props = lk.properties(['MolecularWeight', 'XLogP'])
+        synonyms = lk.synonyms()
+
+    Listkeys expire on the server after a while. If the listkey was created by :meth:`search`, the search is run again
+    automatically when that happens.
+    """
+
+    def __init__(self, listkey, domain='compound', size=None):
+        """Initialize with an existing listkey.
+
+        :param str listkey: The listkey.
+        :param domain: (optional) The domain of the stored records, one of compound, substance or assay.
+        :param int size: (optional) The number of records stored.
+        """
+        self.listkey = listkey
+        """The listkey used to refer to the stored results."""
+        self.domain = domain
+        self.size = size
+        """The number of records stored under this listkey, if known."""
+        self._search = None
+
+    @classmethod
+    def search(cls, identifier, namespace='cid', searchtype=None, domain='compound', **kwargs):
+        """Run a search and store its results on the server.
+
+        :param identifier: The identifier to use as a search query.
+        :param namespace: (optional) The identifier type, e.g. smiles, name or formula.
+        :param searchtype: (optional) The advanced search type, one of substructure, superstructure or similarity.
+        :param domain: (optional) The search domain, one of compound, substance or assay.
+        """
+        listkey = cls(None, domain)
+        listkey._search = (identifier, namespace, searchtype, kwargs)
+        listkey.refresh()
+        return listkey
+
+    def __repr__(self):
+        return 'ListKey(%s)' % self.listkey
+
+    def __len__(self):
+        return self.size or 0
+
+    def refresh(self):
+        """Run the original search again to get a new listkey, for example after the old one has expired."""
+        if self._search is None:
+            raise ValueError('Only a ListKey created by ListKey.search can be refreshed')
+        identifier, namespace, searchtype, kwargs = self._search
+        operation = IDENTIFIER_OPERATIONS.get(self.domain, 'cids')
+        results = get_json(identifier, namespace, self.domain, operation, searchtype, list_return='listkey', **kwargs)
+        if not results:
+            raise NotFoundError('No results found for %s' % identifier)
+        self.listkey = results['IdentifierList']['ListKey']
+        self.size = results['IdentifierList'].get('Size')
+        log.debug('Stored %s results as listkey %s', self.size, self.listkey)
+
+    def get_json(self, operation=None, **kwargs):
+        """Make a request against the stored results and return the parsed JSON response.
+
+        Returns ``None`` if nothing is found. If the server reports that the listkey is unknown or has expired, the
+        original search is run again. Other errors, such as a bad property name, are raised as they are.
+        """
+        try:
+            return json.loads(get(self.listkey, 'listkey', self.domain, operation, 'JSON', **kwargs).decode())
+        except (BadRequestError, NotFoundError) as e:
+            if self._search is None or not _listkey_expired(e):
+                if isinstance(e, NotFoundError):
+                    log.info(e)
+                    return None
+                raise
+            log.info('Listkey %s has expired, searching again: %s', self.listkey, e)
+        self.refresh()
+        return get_json(self.listkey, 'listkey', self.domain, operation, **kwargs)
+
+    def cids(self, **kwargs):
+        """List of CIDs of the stored results."""
+        results = self.get_json('cids', **kwargs)
+        return _identifiers(results, 'CID')
+
+    def sids(self, **kwargs):
+        """List of SIDs of the stored results."""
+        results = self.get_json('sids', **kwargs)
+        return _identifiers(results, 'SID')
+
+    def aids(self, **kwargs):
+        """List of AIDs of the stored results."""
+        results = self.get_json('aids', **kwargs)
+        return _identifiers(results, 'AID')
+
+    def compounds(self, **kwargs):
+        """List of :class:`Compounds <pubchempy.Compound>` for the stored results."""
+        results = self.get_json(**kwargs)
+        return [Compound(r) for r in results['PC_Compounds']] if results else []
+
+    def properties(self, properties, as_dataframe=False, **kwargs):
+        """Retrieve the specified properties of the stored results. See :func:`~pubchempy.get_properties`."""
+        if isinstance(properties, text_types):
+            properties = properties.split(',')
+        operation = 'property/%s' % ','.join([PROPERTY_MAP.get(p, p) for p in properties])
+        results = self.get_json(operation, **kwargs)
+        results = results['PropertyTable']['Properties'] if results else []
+        if as_dataframe:
+            import pandas as pd
+            return pd.DataFrame.from_records(results, index='CID')
+        return results
+
+    def synonyms(self, **kwargs):
+        """Synonyms of the stored results."""
+        results = self.get_json('synonyms', **kwargs)
+        return results['InformationList']['Information'] if results else []
+
+    def iter_cids(self, page_size=PAGE_SIZE, **kwargs):
+        """Iterate over the CIDs of the stored results, retrieving them a page at a time."""
+        return self._paginate(self.cids, page_size, **kwargs)
+
+    def iter_compounds(self, page_size=100, **kwargs):
+        """Iterate over :class:`Compounds <pubchempy.Compound>` for the stored results, a page at a time."""
+        return self._paginate(self.compounds, page_size, **kwargs)
+
+    def iter_properties(self, properties, page_size=PAGE_SIZE, **kwargs):
+        """Iterate over the specified properties of the stored results, a page at a time."""
+        return self._paginate(lambda **kw: self.properties(properties, **kw), page_size, **kwargs)
+
+    def _paginate(self, fetch, page_size, **kwargs):
+        """Yield results from each page returned by ``fetch``, requesting the next page while the current one is used.
+
+        Only one page is held in memory at a time, plus the page being read ahead.
+        """
+        def fetch_page(start):
+            return fetch(listkey_start=start, listkey_count=page_size, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            start = 0
+            future = executor.submit(contextvars.copy_context().run, fetch_page, start)
+            while future is not None:
+                page = future.result()
+                start += page_size
+                if len(page) < page_size or (self.size is not None and start >= self.size):
+                    future = None
+                else:
+                    future = executor.submit(contextvars.copy_context().run, fetch_page, start)
+                for result in page:
+                    yield result
+
+
+def _listkey_expired(error):
+    """Whether an error response says the listkey itself is unknown or expired, rather than anything else failing."""
+    return 'listkey' in str(error).lower()
+
+
+def _identifiers(results, name):
+    if not results:
+        return []
+    elif 'IdentifierList' in results:
+        return results['IdentifierList'][name]
+    elif 'InformationList' in results:
+        return results['InformationList']['Information']
+
+
+def iter_cids(identifier, namespace='cid', searchtype=None, page_size=PAGE_SIZE, **kwargs):
+    """Iterate over the CIDs matching a search, retrieving them a page at a time.
+
+    The search results are stored on the server as a :class:`ListKey`, and the next page is requested while the
+    current one is being used. Memory use stays constant however many results there are.
+
+    :param identifier: The identifier to use as a search query.
+    :param namespace: (optional) The identifier type, e.g. smiles, name or formula.
+    :param searchtype: (optional) The advanced search type, one of substructure, superstructure or similarity.
+    :param int page_size: (optional) The number of results to retrieve in each request.
+    """
+    return ListKey.search(identifier, namespace, searchtype, **kwargs).iter_cids(page_size)
+
+
+def iter_compounds(identifier, namespace='cid', searchtype=None, page_size=100, **kwargs):
+    """Iterate over :class:`Compounds <pubchempy.Compound>` matching a search, retrieving them a page at a time.
+
+    See :func:`iter_cids`.
+    """
+    return ListKey.search(identifier, namespace, searchtype, **kwargs).iter_compounds(page_size)
+
+
+def iter_properties(properties, identifier, namespace='cid', searchtype=None, page_size=PAGE_SIZE, **kwargs):
+    """Iterate over the specified properties of compounds matching a search, retrieving them a page at a time.
+
+    See :func:`iter_cids`.
+    """
+    return ListKey.search(identifier, namespace, searchtype, **kwargs).iter_properties(properties, page_size)
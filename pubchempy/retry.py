@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Retry policy for transient failures when talking to PubChem.
+
+Server errors such as 503 (server busy) or 504 (timeout) and dropped connections are often transient, so rather than
+failing a whole batch, :class:`Retry` waits with exponential backoff and tries again.
+"""
+
+import contextlib
+import contextvars
+import http.client
+import random
+import ssl
+import time
+from email.utils import parsedate_to_datetime
+from urllib.error import HTTPError, URLError
+
+from .deadlines import remaining
+from .errors import DeadlineExceededError
+from .logger import createLogger
+
+log = createLogger(__name__)
+
+
+#: HTTP status codes that are safe to retry.
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+_skipped_status = contextvars.ContextVar('pubchempy_skipped_retry_status', default=frozenset())
+
+
+@contextlib.contextmanager
+def skip_retry(*status):
+    """Context manager that stops the given HTTP status codes being retried by any :class:`Retry` policy inside it.
+
+    Used when the caller has a better way of handling the error, for example :class:`~pubchempy.batch.Batcher` splits
+    a chunk that timed out rather than sending the same oversized request again.
+    """
+    token = _skipped_status.set(_skipped_status.get() | frozenset(status))
+    try:
+        yield
+    finally:
+        _skipped_status.reset(token)
+
+
+class Retry(object):
+    """Retry policy with exponential backoff and jitter.
+
+    The delay before retry ``n`` (counting from zero) is a random value between zero and
+    ``backoff_factor * 2 ** n``, capped at ``backoff_max`` seconds. If the server sends a ``Retry-After`` header, the
+    delay is at least that long.
+
+    :param int total: (optional) Maximum number of retries after the first attempt.
+    :param float backoff_factor: (optional) Base delay in seconds.
+    :param float backoff_max: (optional) Maximum delay in seconds.
+    :param bool jitter: (optional) Randomise delays so concurrent clients don't retry in lockstep.
+    :param status_forcelist: (optional) HTTP status codes that should be retried.
+    :param bool respect_retry_after: (optional) Honour the ``Retry-After`` response header.
+    """
+
+    def __init__(self, total=3, backoff_factor=0.5, backoff_max=30.0, jitter=True, status_forcelist=RETRY_STATUS,
+                 respect_retry_after=True):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.status_forcelist = frozenset(status_forcelist)
+        self.respect_retry_after = respect_retry_after
+
+    def __repr__(self):
+        return 'Retry(total=%s, backoff_factor=%s)' % (self.total, self.backoff_factor)
+
+    def is_retryable(self, error):
+        """Whether the given exception from :meth:`Session.request <pubchempy.Session.request>` may be retried."""
+        if isinstance(error, HTTPError):
+            return error.code in self.status_forcelist and error.code not in _skipped_status.get()
+        if isinstance(error, URLError):
+            error = error.reason
+        if isinstance(error, ssl.CertificateError):
+            return False
+        return isinstance(error, (OSError, http.client.HTTPException))
+
+    def get_backoff(self, attempt):
+        """Return the backoff delay in seconds before the given retry attempt, counting from zero."""
+        backoff = min(self.backoff_max, self.backoff_factor * 2 ** attempt)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+    def get_retry_after(self, error):
+        """Return the delay requested by the ``Retry-After`` header of an error response, or ``None``."""
+        headers = getattr(error, 'headers', None)
+        value = headers.get('Retry-After') if headers is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def get_delay(self, attempt, error):
+        """Return the number of seconds to wait before the given retry attempt."""
+        delay = self.get_backoff(attempt)
+        if self.respect_retry_after:
+            retry_after = self.get_retry_after(error)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def call(self, func, description=''):
+        """Call ``func`` with no arguments, retrying on transient errors according to this policy.
+
+        Gives up with :class:`~pubchempy.errors.DeadlineExceededError` if waiting to retry would pass the current
+        deadline.
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except (URLError, OSError, http.client.HTTPException) as e:
+                if attempt >= self.total or not self.is_retryable(e):
+                    raise
+                delay = self.get_delay(attempt, e)
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise DeadlineExceededError('%s did not complete within its deadline: %s' % (description, e))
+                attempt += 1
+                log.warning('Retrying %s in %.2fs after %s (retry %s of %s)', description, delay, e, attempt,
+                            self.total)
+                time.sleep(delay)
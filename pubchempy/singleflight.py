@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of identical requests that are in flight at the same time.
+
+When many threads ask for the same record at once, only the first actually makes the request. The others wait for it
+to finish and share its response, or its error, so bursts of identical lookups cost a single request to PubChem.
+"""
+
+import threading
+
+from .deadlines import remaining
+from .errors import DeadlineExceededError
+from .logger import createLogger
+
+log = createLogger(__name__)
+
+
+class _Call(object):
+    """A call in flight, which other threads can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Runs at most one call at a time for each key, sharing its outcome with concurrent callers for the same key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+        """Number of calls that were answered by another caller's request."""
+
+    def __repr__(self):
+        return 'SingleFlight(in_flight=%s)' % len(self._calls)
+
+    def do(self, key, func):
+        """Call ``func`` and return its result, unless a call for ``key`` is already running, in which case wait for
+        that call instead and return its result or raise its error.
+
+        The shared call runs under the deadline of whichever caller started it. If it fails with
+        :class:`~pubchempy.errors.DeadlineExceededError` but a waiting caller still has time left, that caller tries
+        again rather than failing with someone else's deadline.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.shared += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    leader = True
+            if leader:
+                break
+            if not call.event.wait(remaining()):
+                raise DeadlineExceededError('Shared request did not complete within its deadline')
+            if isinstance(call.error, DeadlineExceededError) and _has_time():
+                log.debug('Shared request ran out of time, trying again: %s', call.error)
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                log.debug('Shared one response between %s identical requests', call.waiters + 1)
+            call.event.set()
+
+
+def _has_time():
+    """Whether the current caller has no deadline, or hasn't reached it yet."""
+    left = remaining()
+    return left is None or left > 0
+
+
+_flight = SingleFlight()
+
+
+def coalesce(key, func):
+    """Call ``func``, sharing the call with any concurrent callers using the same ``key``."""
+    return _flight.do(key, func)
@@ -1,7 +1,7 @@
 import json
-from .functions import get_json, request
+from .functions import get, get_json
 from .mapper import CompoundIdType
-from .decorators import memoized_property
+from .decorators import memoized_property, with_deadline
 from .compound import Compound
 from .logger import createLogger
 
@@ -20,12 +20,13 @@ class Substance(object):
     """
 
     @classmethod
+    @with_deadline
     def from_sid(cls, sid):
         """Retrieve the Substance record for the specified SID.
 
         :param int sid: The PubChem Substance Identifier (SID).
         """
-        record = json.loads(request(sid, 'sid', 'substance').read().decode())['PC_Substances'][0]
+        record = json.loads(get(sid, 'sid', 'substance').decode())['PC_Substances'][0]
         return cls(record)
 
     def __init__(self, record):
@@ -129,6 +130,7 @@ class Substance(object):
         results = get_json(self.sid, 'sid', 'substance', 'aids')
         return results['InformationList']['Information'][0]['AID'] if results else []
 
+@with_deadline
 def get_substances(identifier, namespace='sid', as_dataframe=False, **kwargs):
     """Retrieve the specified substance records from PubChem.
 
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side rate limiting that keeps requests within the PubChem usage policy.
+
+PubChem asks for no more than 5 requests per second and 400 requests per minute, and reports its current load in the
+``X-Throttling-Control`` response header. :class:`RateLimiter` schedules requests with a token bucket for each limit
+and slows down when the server reports that it is busy.
+"""
+
+import re
+import threading
+import time
+
+from .deadlines import remaining
+from .errors import DeadlineExceededError
+from .logger import createLogger
+
+log = createLogger(__name__)
+
+
+#: Default limits as (number of requests, period in seconds), from the PubChem usage policy.
+PUBCHEM_LIMITS = ((5, 1.0), (400, 60.0))
+
+#: Fraction of the configured rate to use for each throttling status reported by PubChem.
+STATUS_FACTORS = {'green': 1.0, 'yellow': 0.5, 'red': 0.2, 'black': 0.05}
+
+_STATUS_RE = re.compile(r'(Request Count|Request Time|Service) status:\s*(\w+)', re.IGNORECASE)
+
+
+class TokenBucket(object):
+    """Token bucket allowing bursts of up to ``capacity`` requests, refilled at ``capacity / period`` per second."""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def __repr__(self):
+        return 'TokenBucket(%s, %s)' % (self.capacity, self.period)
+
+    def reserve(self, now, factor=1.0):
+        """Take a token and return the number of seconds to wait before it may be used."""
+        rate = self.capacity / self.period * factor
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / rate if self.tokens < 0 else 0.0
+
+
+class RateLimiter(object):
+    """Thread-safe scheduler that spaces requests to stay within a set of rate limits.
+
+    :param limits: (optional) Sequence of ``(requests, period)`` pairs. Defaults to the PubChem usage policy.
+    :param bool adaptive: (optional) Slow down when the server reports yellow, red or black throttling status.
+    """
+
+    def __init__(self, limits=PUBCHEM_LIMITS, adaptive=True):
+        self.buckets = [TokenBucket(n, period) for n, period in limits]
+        self.adaptive = adaptive
+        self.factor = 1.0
+        """Fraction of the configured rate currently in use, reduced when the server reports it is busy."""
+        self.status = 'green'
+        """The most severe throttling status reported in the last response."""
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'RateLimiter(%s)' % ', '.join('%s/%ss' % (b.capacity, b.period) for b in self.buckets)
+
+    def reserve(self):
+        """Reserve a slot for one request and return the number of seconds to wait before sending it.
+
+        The slot is taken immediately, so concurrent callers are queued behind each other rather than all waking at
+        once. Asynchronous callers can sleep for the returned delay without blocking the event loop.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return max(bucket.reserve(now, self.factor) for bucket in self.buckets)
+
+    def acquire(self):
+        """Block until a request may be sent.
+
+        Raises :class:`~pubchempy.errors.DeadlineExceededError` rather than waiting past the current deadline.
+        """
+        delay = self.reserve()
+        left = remaining()
+        if left is not None and delay > left:
+            raise DeadlineExceededError('Rate limit would delay request past its deadline')
+        if delay > 0:
+            log.debug('Rate limit reached, waiting %.2fs', delay)
+            time.sleep(delay)
+
+    def update(self, headers):
+        """Adjust the request rate using the ``X-Throttling-Control`` header of a response."""
+        if not self.adaptive or headers is None:
+            return
+        header = headers.get('X-Throttling-Control')
+        if not header:
+            return
+        statuses = [s.lower() for _, s in _STATUS_RE.findall(header)]
+        if not statuses:
+            return
+        status = min(statuses, key=lambda s: STATUS_FACTORS.get(s, 1.0))
+        target = STATUS_FACTORS.get(status, 1.0)
+        with self._lock:
+            if target < self.factor:
+                log.info('PubChem throttling status %s, reducing request rate', status)
+                self.factor = target
+            elif self.factor < target:
+                # Recover gradually once the server is less busy
+                self.factor = min(target, self.factor * 1.25)
+            self.status = status
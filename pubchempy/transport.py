@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled keep-alive HTTP transport used for all requests to the PubChem servers.
+
+A :class:`Session` keeps a bounded pool of persistent connections per host, so consecutive requests reuse an existing
+TCP/TLS connection instead of paying the connection setup cost each time. Responses are requested with gzip or deflate
+compression and decompressed as they are read.
+"""
+
+import base64
+import http.client
+import io
+import threading
+import zlib
+from collections import deque
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+from .circuit import FAILURE_STATUS
+from .deadlines import limit_timeout
+from .hedge import paused
+from .logger import createLogger
+from .retry import Retry
+from .throttle import RateLimiter
+
+log = createLogger(__name__)
+
+
+USER_AGENT = 'PubChemPy'
+
+#: HTTP status codes that are followed as redirects.
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+#: Size in bytes of each block read from the socket.
+READ_BLOCK_SIZE = 65536
+
+#: Default time in seconds to wait for the server to send data.
+DEFAULT_TIMEOUT = 60.0
+
+#: Default time in seconds to wait for a connection to open.
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+def read_body(resp):
+    """Read the body of an :class:`http.client.HTTPResponse`, decompressing gzip or deflate content as it arrives."""
+    encoding = resp.headers.get('Content-Encoding', '').strip().lower()
+    if encoding not in {'gzip', 'x-gzip', 'deflate'}:
+        return resp.read()
+    # Automatically detect gzip or zlib headers
+    decoder = zlib.decompressobj(32 + zlib.MAX_WBITS)
+    chunks = []
+    first = True
+    while True:
+        block = resp.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        try:
+            chunks.append(decoder.decompress(block))
+        except zlib.error:
+            if not (first and encoding == 'deflate'):
+                raise
+            # Some servers send raw deflate data without the zlib header
+            decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            chunks.append(decoder.decompress(block))
+        first = False
+    chunks.append(decoder.flush())
+    del resp.headers['Content-Encoding']
+    del resp.headers['Content-Length']
+    return b''.join(chunks)
+
+
+def proxy_headers(proxy):
+    """Return the headers to send when opening a tunnel through a proxy, with any credentials from its URL.
+
+    :param proxy: The proxy URL, as returned by :func:`~urllib.parse.urlsplit`.
+    """
+    if proxy.username is None:
+        return {}
+    credentials = '%s:%s' % (unquote(proxy.username), unquote(proxy.password or ''))
+    return {'Proxy-Authorization': 'Basic %s' % base64.b64encode(credentials.encode('utf8')).decode('ascii')}
+
+
+class Response(object):
+    """A fully-read HTTP response.
+
+    Mimics the file-like object returned by ``urlopen`` so existing code that calls ``read()``, ``getcode()`` or
+    inspects ``headers`` keeps working. The body is read eagerly so the underlying connection can be returned to the
+    pool straight away.
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._fp = io.BytesIO(body)
+
+    def __repr__(self):
+        return 'Response(%s, %s)' % (self.status, self.url)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def code(self):
+        return self.status
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        return self._fp.read() if amt is None else self._fp.read(amt)
+
+    def close(self):
+        self._fp.close()
+
+
+class ConnectionPool(object):
+    """A bounded pool of persistent connections to a single host.
+
+    At most ``maxsize`` connections are open at once. Callers beyond that wait for a connection to be released.
+    """
+
+    def __init__(self, scheme, host, port, maxsize=10, proxy=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.proxy = proxy
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    def __repr__(self):
+        return 'ConnectionPool(%s://%s:%s)' % (self.scheme, self.host, self.port)
+
+    def _new_conn(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        if self.proxy:
+            proxy = urlsplit(self.proxy)
+            conn = cls(proxy.hostname, proxy.port, timeout=timeout)
+            conn.set_tunnel(self.host, self.port, headers=proxy_headers(proxy))
+        else:
+            conn = cls(self.host, self.port, timeout=timeout)
+        return conn
+
+    def _get_conn(self):
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def _put_conn(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None, connect_timeout=None):
+        """Send a request over a pooled connection and return a fully-read :class:`Response`.
+
+        :param float timeout: (optional) Maximum time in seconds to wait for each read from the server.
+        :param float connect_timeout: (optional) Maximum time in seconds to wait when opening a new connection.
+        """
+        parts = urlsplit(url)
+        path = parts.path + ('?%s' % parts.query if parts.query else '')
+        # Waiting for a free connection isn't server latency, so don't let it trigger a hedged duplicate
+        with paused():
+            self._slots.acquire()
+        try:
+            conn = self._get_conn()
+            if conn is not None:
+                try:
+                    return self._send(conn, method, url, path, body, headers, timeout, connect_timeout)
+                except ConnectionError:
+                    # Server closed an idle keep-alive connection, so try again with a fresh one
+                    log.debug('Reconnecting to %s after stale connection', self.host)
+            conn = self._new_conn(connect_timeout)
+            return self._send(conn, method, url, path, body, headers, timeout, connect_timeout)
+        finally:
+            self._slots.release()
+
+    def _send(self, conn, method, url, path, body, headers, timeout, connect_timeout=None):
+        try:
+            if conn.sock is None:
+                conn.timeout = connect_timeout
+                conn.connect()
+            conn.sock.settimeout(timeout)
+            conn.request(method, path, body, headers or {})
+            resp = conn.getresponse()
+            data = read_body(resp)
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put_conn(conn)
+        return Response(url, resp.status, resp.reason, resp.headers, data)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class Session(object):
+    """Reusable HTTP session that keeps a pool of keep-alive connections for each host.
+
+    Every request has a connect and read timeout, shortened further to fit any deadline set with
+    :func:`~pubchempy.deadlines.deadline`.
+
+    :param int maxsize: (optional) Maximum number of simultaneous connections per host.
+    :param float timeout: (optional) Read timeout in seconds: the longest to wait for the server to send data.
+    :param rate_limiter: (optional) :class:`~pubchempy.RateLimiter` shared by all requests. Defaults to the PubChem
+                         usage policy. Set to ``False`` to disable rate limiting.
+    :param retry: (optional) :class:`~pubchempy.Retry` policy for transient errors. Set to ``False`` to disable
+                  retries.
+    :param float connect_timeout: (optional) Connect timeout in seconds: the longest to wait to open a connection.
+    :param hedge: (optional) :class:`~pubchempy.Hedge` policy for sending duplicates of slow requests. Disabled by
+                  default.
+    :param circuit_breaker: (optional) :class:`~pubchempy.CircuitBreaker` that fails requests fast during outages.
+                            Disabled by default.
+    """
+
+    def __init__(self, maxsize=10, timeout=DEFAULT_TIMEOUT, rate_limiter=None, retry=None,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, hedge=None, circuit_breaker=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.hedge = hedge
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter or None
+        self.retry = Retry() if retry is None else retry or None
+        self.headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'}
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Session(maxsize=%s)' % self.maxsize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pool(self, url):
+        """Return the :class:`ConnectionPool` for the host of the given URL, creating it if necessary."""
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        with self._lock:
+            if key not in self._pools:
+                proxy = getproxies().get(scheme)
+                if proxy and proxy_bypass(parts.hostname):
+                    proxy = None
+                self._pools[key] = ConnectionPool(scheme, parts.hostname, port, self.maxsize, proxy)
+            return self._pools[key]
+
+    def request(self, url, data=None, headers=None):
+        """Make a request and return a :class:`Response`.
+
+        Requests are sent as POST when ``data`` is given, otherwise GET. Transient errors are retried according to
+        the :attr:`retry` policy. Raises :class:`~urllib.error.HTTPError` for error status codes and
+        :class:`~urllib.error.URLError` if the server cannot be reached, as ``urlopen`` does.
+        """
+        if self.hedge is None:
+            attempt = lambda: self._request(url, data, headers)
+        else:
+            attempt = lambda: self._hedged_request(url, data, headers)
+        if self.retry is None:
+            return attempt()
+        return self.retry.call(attempt, url)
+
+    def _hedged_request(self, url, data=None, headers=None):
+        # Wait for the rate limiter before the hedge starts timing, so queueing for a token isn't taken as a slow
+        # response. Each duplicate waits for its own token before it is sent.
+        self._acquire()
+        send = lambda: self._request(url, data, headers, acquired=True)
+        return self.hedge.call(send, url, prepare=self._acquire)
+
+    def _acquire(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _request(self, url, data=None, headers=None, acquired=False):
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return self._send(url, data, headers, acquired)
+        probe = breaker.acquire()
+        try:
+            response = self._send(url, data, headers, acquired)
+        except HTTPError as e:
+            breaker.record(e.code not in FAILURE_STATUS, probe)
+            raise
+        except URLError:
+            breaker.record(False, probe)
+            raise
+        except BaseException:
+            breaker.record(None, probe)
+            raise
+        breaker.record(True, probe)
+        return response
+
+    def _send(self, url, data=None, headers=None, acquired=False):
+        method = 'POST' if data is not None else 'GET'
+        all_headers = dict(self.headers)
+        if data is not None:
+            all_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        all_headers.update(headers or {})
+        for redirects in range(5):
+            if not (acquired and redirects == 0):
+                self._acquire()
+            timeout, connect_timeout = limit_timeout(self.timeout), limit_timeout(self.connect_timeout)
+            try:
+                response = self.pool(url).urlopen(method, url, data, all_headers, timeout, connect_timeout)
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e)
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(response.headers)
+            if response.status in REDIRECT_CODES and response.headers.get('Location'):
+                url = urljoin(url, response.headers['Location'])
+                if response.status == 303:
+                    method, data = 'GET', None
+                continue
+            if response.status >= 400:
+                raise HTTPError(url, response.status, response.reason, response.headers, response)
+            return response
+        raise URLError('Too many redirects')
+
+    def close(self):
+        """Close all pooled connections."""
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared :class:`Session` used by all PubChemPy requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+        return _session
+
+
+def set_session(session):
+    """Replace the shared :class:`Session` used by all PubChemPy requests."""
+    global _session
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None and old is not session:
+        old.close()
@@ -23,7 +23,8 @@ setup(
     description='A simple Python wrapper around the PubChem PUG REST API.',
     long_description=long_description,
     keywords='pubchem python rest api chemistry cheminformatics',
-    extras_require={'pandas': ['pandas']},
+    python_requires='>=3.7',
+    extras_require={'pandas': ['pandas'], 'numpy': ['numpy'], 'async': ['aiohttp']},
     test_suite='pubchempy_test',
     classifiers=[
         'Intended Audience :: Science/Research',
@@ -37,8 +38,8 @@ setup(
         'Topic :: Internet',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
     ],
 )
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+conftest
+~~~~~~~~
+
+Shared fixtures, including a local stand-in for the PubChem PUG REST server so transport behaviour can be tested
+without network access.
+
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pubchempy import functions, transport
+
+
+class FakePubChem(object):
+    """Local HTTP server that answers every request using a replaceable handler function.
+
+    The handler receives the request method, path and body and returns a ``(status, headers, body)`` tuple.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = 0
+        self.handler = lambda method, path, body: (200, {'Content-Type': 'application/json'}, b'{}')
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                fake.connections += 1
+                BaseHTTPRequestHandler.setup(self)
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                fake.requests.append((self.command, self.path, body, dict(self.headers)))
+                status, headers, data = fake.handler(self.command, self.path, body)
+                if not isinstance(data, bytes):
+                    data = json.dumps(data).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_CONNECT = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_pubchem(monkeypatch):
+    """A local fake PubChem server, with PubChemPy pointed at it through a fresh :class:`~pubchempy.Session`."""
+    fake = FakePubChem()
+    monkeypatch.setattr(functions, 'API_BASE', fake.url + '/rest/pug')
+    monkeypatch.setattr(functions, 'API_VIEW', fake.url + '/rest/pug_view/data/compound')
+    monkeypatch.setattr(transport, '_session', transport.Session(rate_limiter=False))
+    yield fake
+    transport.get_session().close()
+    fake.close()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+test_aio
+~~~~~~~~
+
+Test the optional asyncio interface.
+
+"""
+
+import asyncio
+
+import pytest
+
+from pubchempy import Compound
+from pubchempy.errors import NotFoundError
+
+
+# Skip tests in this module if aiohttp is not installed
+aiohttp = pytest.importorskip('aiohttp')
+
+from pubchempy import aio
+
+
+RECORD = {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': [1], 'element': [6]}}]}
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await aio.get_async_session().close()
+    return asyncio.run(wrapper())
+
+
+def test_from_cid_async(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, RECORD)
+    c = run(Compound.from_cid_async(241))
+    assert c.cid == 241
+
+
+def test_gather(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, {'IdentifierList': {'CID': [int(body[4:])]}})
+
+    async def main():
+        return await asyncio.gather(*[aio.get_cids(i, 'cid') for i in range(1, 11)])
+
+    assert run(main()) == [[i] for i in range(1, 11)]
+
+
+def test_not_found(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (404, {}, {'Fault': {'Details': ['No CID found']}})
+    assert run(aio.get_compounds(999999999)) == []
+    with pytest.raises(NotFoundError):
+        run(Compound.from_cid_async(999999999))
+
+
+def test_session_closed_at_shutdown(fake_pubchem):
+    """The session for a loop should be closed when asyncio.run finishes, without closing it explicitly."""
+    fake_pubchem.handler = lambda method, path, body: (200, {}, RECORD)
+    sessions = []
+
+    async def main():
+        sessions.append(aio.get_async_session())
+        return await Compound.from_cid_async(241)
+
+    assert asyncio.run(main()).cid == 241
+    assert sessions[0]._client is None
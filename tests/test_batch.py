@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+test_batch
+~~~~~~~~~~
+
+Test splitting large identifier lists into chunks.
+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import pytest
+
+from pubchempy import *
+from pubchempy.batch import Batcher, MicroBatcher, merge_json, set_batcher, set_micro_batcher
+from pubchempy.errors import BadRequestError, NotFoundError, TimeoutError
+
+
+@pytest.fixture
+def batcher():
+    """Install a batcher with small chunks for the duration of a test."""
+    batcher = Batcher(chunk_size=10, max_workers=4, adaptive=False)
+    set_batcher(batcher)
+    yield batcher
+    set_batcher(None)
+
+
+def posted_cids(body):
+    return [int(cid) for cid in parse_qs(body.decode())['cid'][0].split(',')]
+
+
+def property_handler(method, path, body):
+    cids = posted_cids(body)
+    # Make later chunks return faster, to check results are still merged in input order
+    time.sleep(0.05 / cids[0])
+    return 200, {}, {'PropertyTable': {'Properties': [{'CID': cid, 'MolecularWeight': cid * 2} for cid in cids]}}
+
+
+def test_chunks():
+    assert Batcher(chunk_size=3).chunks(list(range(8))) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+
+
+def test_merge_json():
+    results = [
+        {'PC_Compounds': [{'id': 1}, {'id': 2}]},
+        None,
+        {'PC_Compounds': [{'id': 3}]},
+    ]
+    assert merge_json(results) == {'PC_Compounds': [{'id': 1}, {'id': 2}, {'id': 3}]}
+    assert merge_json([None, None]) is None
+
+
+def test_properties_chunked(fake_pubchem, batcher):
+    fake_pubchem.handler = property_handler
+    cids = list(range(1, 36))
+    results = get_properties('MolecularWeight', cids)
+    assert [r['CID'] for r in results] == cids
+    assert len(fake_pubchem.requests) == 4
+    assert all(len(posted_cids(body)) <= 10 for _, _, body, _ in fake_pubchem.requests)
+
+
+def test_identifiers_chunked(fake_pubchem, batcher):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, {'InformationList': {'Information': [
+        {'CID': cid, 'SID': [cid * 10]} for cid in posted_cids(body)]}})
+    results = get_sids(list(range(1, 26)))
+    assert [r['CID'] for r in results] == list(range(1, 26))
+
+
+def test_no_chunking_for_searches(fake_pubchem, batcher):
+    """Single identifiers and names should be sent as they are."""
+    get_cids('Aspirin', 'name')
+    get_sids(list(range(1, 26)), 'name')
+    assert len(fake_pubchem.requests) == 2
+
+
+def test_adaptive_growth():
+    """Chunk size should grow while responses are fast, and be remembered for the same kind of request."""
+    batcher = Batcher(chunk_size=10, max_workers=1, target_latency=1.0)
+    sizes = []
+    results = batcher.map(lambda chunk: sizes.append(len(chunk)) or chunk, list(range(200)), key='cids')
+    assert sum(results, []) == list(range(200))
+    assert sizes[0] == 10
+    assert sizes[1] > sizes[0]
+    assert batcher.size('cids') > 10
+    assert batcher.size('records') == 10
+
+
+def test_adaptive_timeout():
+    """Chunks that time out should be halved and resubmitted, and the smaller size remembered."""
+    batcher = Batcher(chunk_size=40, max_workers=2, target_latency=1.0)
+    sizes = []
+
+    def fetch(chunk):
+        sizes.append(len(chunk))
+        if len(chunk) > 10:
+            raise TimeoutError()
+        return chunk
+
+    results = batcher.map(fetch, list(range(100)), key='3d')
+    assert sum(results, []) == list(range(100))
+    assert max(sizes[2:]) <= 20
+    assert batcher.size('3d') <= 20
+
+
+def test_timeout_single_identifier():
+    """A single identifier that times out cannot be split further."""
+    def fetch(chunk):
+        raise TimeoutError()
+    with pytest.raises(TimeoutError):
+        Batcher(chunk_size=4).map(fetch, [1, 2, 3])
+
+
+def test_bisect_bad_identifier(fake_pubchem, batcher):
+    """A bad identifier should be isolated without losing the rest of its chunk."""
+    def handler(method, path, body):
+        cids = parse_qs(body.decode())['cid'][0].split(',')
+        if 'abc' in cids:
+            return 400, {}, {'Fault': {'Code': 'PUGREST.BadRequest', 'Details': ['Invalid CID']}}
+        return 200, {}, {'PropertyTable': {'Properties': [{'CID': int(cid)} for cid in cids]}}
+    fake_pubchem.handler = handler
+    cids = list(range(1, 7)) + ['abc'] + list(range(7, 25))
+    results = get_properties('MolecularWeight', cids, errors='collect')
+    assert [r['CID'] for r in results] == list(range(1, 25))
+    assert [identifier for identifier, error in results.failures] == ['abc']
+    assert isinstance(results.failures[0][1], BadRequestError)
+    with pytest.raises(BadRequestError):
+        get_properties('MolecularWeight', cids)
+
+
+def test_collect_single_identifier(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (400, {}, {'Fault': {'Details': ['Invalid SMILES']}})
+    results = get_compounds('C(C', 'smiles', errors='collect')
+    assert results == []
+    assert results.failures[0][0] == 'C(C'
+    with pytest.raises(ValueError):
+        get_compounds('C(C', 'smiles', errors='ignore')
+
+
+@pytest.fixture
+def micro_batcher():
+    """Install a micro-batcher for the duration of a test."""
+    micro_batcher = MicroBatcher(window=0.1, max_size=5)
+    set_micro_batcher(micro_batcher)
+    yield micro_batcher
+    set_micro_batcher(None)
+
+
+def record_handler(method, path, body):
+    cids = [cid for cid in posted_cids(body) if cid < 100]
+    if not cids:
+        return 404, {}, {'Fault': {'Code': 'PUGREST.NotFound'}}
+    records = [{'id': {'id': {'cid': cid}}, 'atoms': {'aid': [1], 'element': [6]}} for cid in cids]
+    return 200, {}, {'PC_Compounds': records}
+
+
+def test_micro_batch(fake_pubchem, micro_batcher):
+    """Concurrent single-CID lookups should be sent together, and each caller get its own result."""
+    fake_pubchem.handler = record_handler
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        compounds = list(executor.map(Compound.from_cid, [1, 2, 3, 2]))
+    assert [c.cid for c in compounds] == [1, 2, 3, 2]
+    assert len(fake_pubchem.requests) == 1
+    assert sorted(posted_cids(fake_pubchem.requests[0][2])) == [1, 2, 3]
+
+
+def test_micro_batch_max_size(fake_pubchem, micro_batcher):
+    """Full batches should be sent without waiting for the window to close."""
+    fake_pubchem.handler = property_handler
+    micro_batcher.window = 10
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda cid: get_properties('MolecularWeight', cid), range(1, 6)))
+    assert [r[0]['MolecularWeight'] for r in results] == [2, 4, 6, 8, 10]
+    assert len(fake_pubchem.requests) == 1
+
+
+def test_micro_batch_not_found(fake_pubchem, micro_batcher):
+    fake_pubchem.handler = record_handler
+
+    def from_cid(cid):
+        try:
+            return Compound.from_cid(cid).cid
+        except NotFoundError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert list(executor.map(from_cid, [1, 200, 300])) == [1, None, None]
+    assert len(fake_pubchem.requests) == 1
+    assert from_cid(400) is None
+
+
+def test_micro_batch_bad_request():
+    """A bad identifier should only fail its own lookup."""
+    def fetch(identifiers):
+        if 'bad' in identifiers:
+            raise BadRequestError()
+        return dict((i, i.upper()) for i in identifiers)
+
+    micro_batcher = MicroBatcher(window=0.1)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(micro_batcher.call, 'key', i, fetch) for i in ['a', 'bad', 'c']]
+    assert futures[0].result() == 'A'
+    assert futures[2].result() == 'C'
+    with pytest.raises(BadRequestError):
+        futures[1].result()
+
+
+def test_adaptive_timeout_not_retried(fake_pubchem):
+    """With the default retry policy, a chunk that times out should be split at once rather than retried first."""
+    def handler(method, path, body):
+        cids = posted_cids(body)
+        if len(cids) > 10:
+            return 504, {}, {'Fault': {'Code': 'PUGREST.Timeout', 'Message': 'Request timed out'}}
+        return 200, {}, {'InformationList': {'Information': [{'CID': cid, 'SID': [cid * 10]} for cid in cids]}}
+    fake_pubchem.handler = handler
+    set_batcher(Batcher(chunk_size=40, max_workers=1))
+    try:
+        results = get_sids(list(range(1, 41)))
+    finally:
+        set_batcher(None)
+    assert [r['CID'] for r in results] == list(range(1, 41))
+    # One request for 40, two for 20 and four for 10, with no retries
+    assert len(fake_pubchem.requests) == 7
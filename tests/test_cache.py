@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+test_cache
+~~~~~~~~~~
+
+Test response caching.
+
+"""
+
+import os
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import NotFoundError
+from pubchempy.cache import (NOT_FOUND, MemoryCache, SQLiteCache, TieredCache, cached, get_cache, invalidate, make_key,
+                             set_cache)
+
+
+RECORD = {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': [1], 'element': [6]}}]}
+
+SDS = {'Record': {'Section': [{'Section': [{'Section': [{'Information': [
+    {'Name': 'GHS Hazard Statements', 'Value': {'StringWithMarkup': [{'String': 'H225: Highly Flammable'}]}},
+]}]}]}]}}
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    set_cache(cache)
+    yield cache
+    set_cache(None)
+    cache.close()
+
+
+def test_make_key():
+    assert make_key([1, 2], 'cid') == make_key('1,2', 'cid')
+    assert make_key(1, listkey_count=3, b=None) == make_key('1', listkey_count='3')
+    assert make_key(1, operation='synonyms') != make_key(1)
+
+
+def test_sqlite_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), ttl=60, ttls={'synonyms': 0})
+    cache.set('a', b'data')
+    assert cache.get('a') == b'data'
+    assert cache.get('b') is None
+    assert cache.stats == {'hits': 1, 'misses': 1, 'size': 1}
+    cache.set('s', b'synonyms', cache.ttl_for('synonyms'))
+    time.sleep(0.01)
+    assert cache.get('s') is None
+    assert cache.get('s', stale=True) == b'synonyms'
+    cache.delete('a')
+    assert cache.get('a') is None
+    cache.close()
+    # Entries persist between instances
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    assert cache.get('s', stale=True) == b'synonyms'
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_sqlite_eviction(tmp_path):
+    """Least recently used entries should be evicted when the cache is full."""
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), max_size=2000)
+    data = [os.urandom(800) for _ in range(3)]
+    for i, value in enumerate(data):
+        cache.set(str(i), value)
+        time.sleep(0.01)
+        cache.get('0')
+    assert cache.get('0') is not None
+    assert cache.get('1') is None
+    assert cache.get('2') is not None
+
+
+def test_cached_requests(fake_pubchem, sqlite_cache):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, SDS if 'pug_view' in path else RECORD)
+    assert Compound.from_cid(241).cid == 241
+    assert get_compounds(241)[0].cid == 241
+    assert request_SDS(241)['hazard'] == ['H225']
+    assert request_SDS(241)['hazard'] == ['H225']
+    assert len(fake_pubchem.requests) == 2
+    # Different parameters are cached separately
+    Compound.from_cid(241, record_type='3d')
+    assert len(fake_pubchem.requests) == 3
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_entries=2, ttl=60, ttls={'synonyms': 0})
+    cache.set('a', b'a')
+    cache.set('b', b'b')
+    assert cache.get('a') == b'a'
+    cache.set('c', b'c')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a'
+    assert cache.get('c') == b'c'
+    cache.put('s', b's', 'synonyms')
+    assert cache.get('s') is None
+    assert cache.get('s', stale=True) == b's'
+    assert cache.stats == {'hits': 4, 'misses': 2, 'size': 2}
+
+
+def test_tiered_cache(tmp_path):
+    memory = MemoryCache()
+    disk = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    cache = TieredCache(memory, disk)
+    cache.put('a', b'a')
+    assert memory.get('a') == disk.get('a') == b'a'
+    memory.clear()
+    assert cache.get('a') == b'a'
+    assert memory.get('a') == b'a'
+    cache.delete('a')
+    assert cache.get('a') is None
+    assert cache.stats['hits'] == 1
+    disk.close()
+
+
+def test_tiered_cache_ttl(tmp_path):
+    """Entries copied into an earlier cache should expire no later than the original."""
+    memory = MemoryCache(ttl=3600)
+    disk = SQLiteCache(str(tmp_path / 'cache.sqlite'), ttls={'synonyms': 0.1})
+    cache = TieredCache(memory, disk)
+    disk.put('s', b's', 'synonyms')
+    assert cache.get('s') == b's'
+    assert memory.get('s') == b's'
+    value, ttl = memory.get_entry('s')
+    assert 0 < ttl <= 0.1
+    time.sleep(0.15)
+    assert cache.get('s') is None
+    disk.close()
+
+
+def test_tiered_cache_stale(tmp_path):
+    """An expired entry served from a later cache should not be copied into earlier caches as fresh."""
+    memory = MemoryCache()
+    disk = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    cache = TieredCache(memory, disk)
+    disk.set('a', b'a', ttl=0)
+    assert cache.get('a', stale=True) == b'a'
+    assert memory.get('a', stale=True) is None
+    assert cache.get('a') is None
+    disk.close()
+
+
+def test_invalidate(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, RECORD)
+    set_cache(MemoryCache())
+    try:
+        Compound.from_cid(241)
+        Compound.from_cid(241)
+        assert len(fake_pubchem.requests) == 1
+        invalidate(241)
+        Compound.from_cid(241)
+        assert len(fake_pubchem.requests) == 2
+    finally:
+        set_cache(None)
+
+
+def test_cached_properties(fake_pubchem):
+    def handler(method, path, body):
+        tags = path.split('/property/')[1].split('/')[0].split(',')
+        cids = [int(cid) for cid in parse_qs(body.decode())['cid'][0].split(',')]
+        rows = [dict([('CID', cid)] + [(tag, cid * 10) for tag in tags if not (tag == 'XLogP' and cid == 3)])
+                for cid in cids]
+        return 200, {}, {'PropertyTable': {'Properties': rows}}
+
+    fake_pubchem.handler = handler
+    set_cache(MemoryCache())
+    try:
+        assert get_properties('MolecularWeight', [1, 2]) == [{'CID': 1, 'MolecularWeight': 10},
+                                                            {'CID': 2, 'MolecularWeight': 20}]
+        results = get_properties(['MolecularWeight', 'XLogP'], [1, 2, 3])
+        assert results == [{'CID': 1, 'MolecularWeight': 10, 'XLogP': 10},
+                           {'CID': 2, 'MolecularWeight': 20, 'XLogP': 20},
+                           {'CID': 3, 'MolecularWeight': 30}]
+        # Only the missing properties were requested, grouped by the CIDs missing them
+        paths = sorted((path.split('/property/')[1], body) for _, path, body, _ in fake_pubchem.requests[1:])
+        assert paths == [('MolecularWeight,XLogP/JSON', b'cid=3'), ('XLogP/JSON', b'cid=1%2C2')]
+        # Everything is now cached, including the missing XLogP for CID 3
+        assert get_properties('MolecularWeight,XLogP', '3,1') == [results[2], results[0]]
+        assert len(fake_pubchem.requests) == 3
+    finally:
+        set_cache(None)
+
+
+def test_negative_cache(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (404, {}, {'Fault': {'Code': 'PUGREST.NotFound'}})
+    set_cache(MemoryCache(negative_ttl=60))
+    try:
+        assert get_cids('notaname', 'name') == []
+        assert get_cids('notaname', 'name') == []
+        assert get_compounds('notaname', 'name') == []
+        for _ in range(2):
+            with pytest.raises(NotFoundError):
+                request_SDS(999999999)
+        assert len(fake_pubchem.requests) == 3
+        get_cache().negative_ttl = 0
+        invalidate('notaname', 'name', operation='cids')
+        get_cids('notaname', 'name')
+        get_cids('notaname', 'name')
+        assert len(fake_pubchem.requests) == 5
+    finally:
+        set_cache(None)
+
+
+def test_negative_cached_properties(fake_pubchem):
+    def handler(method, path, body):
+        cids = [int(cid) for cid in parse_qs(body.decode())['cid'][0].split(',')]
+        return 200, {}, {'PropertyTable': {'Properties': [{'CID': cid, 'XLogP': 1.0} for cid in cids if cid < 100]}}
+
+    fake_pubchem.handler = handler
+    set_cache(MemoryCache())
+    try:
+        assert get_properties('XLogP', [1, 200]) == [{'CID': 1, 'XLogP': 1.0}]
+        assert get_properties('XLogP,TPSA', [1, 200]) == [{'CID': 1, 'XLogP': 1.0}]
+        # Only TPSA for CID 1 is requested, since CID 200 is remembered as not found
+        assert fake_pubchem.requests[1][2] == b'cid=1'
+        # When collecting failures, CID 200 is reported the same way whether or not it was already cached
+        set_cache(MemoryCache())
+        for _ in range(2):
+            results = get_properties('XLogP', [1, 200], errors='collect')
+            assert results == [{'CID': 1, 'XLogP': 1.0}]
+            assert [identifier for identifier, error in results.failures] == ['200']
+            assert isinstance(results.failures[0][1], NotFoundError)
+        assert len(fake_pubchem.requests) == 3
+    finally:
+        set_cache(None)
+
+
+def test_empty_response_cached(tmp_path):
+    """An empty response should be cached as it is, not mistaken for a not found result."""
+    disk = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    for cache in [MemoryCache(), disk]:
+        cache.put('empty', b'')
+        cache.put_not_found('missing')
+        assert cache.get('empty') == b''
+        assert cache.get('missing') is NOT_FOUND
+        set_cache(cache)
+        try:
+            assert cached('k', 'cids', lambda: b'') == b''
+            assert cached('k', 'cids', lambda: b'other') == b''
+            with pytest.raises(NotFoundError):
+                cached('missing', 'cids', lambda: b'')
+        finally:
+            set_cache(None)
+    disk.close()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+test_circuit
+~~~~~~~~~~~~
+
+Test the circuit breaker.
+
+"""
+
+import time
+
+import pytest
+
+from pubchempy import *
+from pubchempy import transport
+from pubchempy.cache import MemoryCache, set_cache
+from pubchempy.errors import CircuitOpenError, NotFoundError, PubChemHTTPError
+
+
+RECORD = {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': [1], 'element': [6]}}]}
+
+
+def open_breaker(breaker):
+    while breaker.state == 'closed':
+        breaker.acquire()
+        breaker.record(False)
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, recovery_timeout=0.2)
+    for success in [True, False, True]:
+        breaker.acquire()
+        breaker.record(success)
+    assert breaker.state == 'closed'
+    breaker.acquire()
+    breaker.record(False)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    time.sleep(0.25)
+    assert breaker.state == 'half-open'
+    probe = breaker.acquire()
+    assert probe is not None
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(True, probe)
+    assert breaker.state == 'closed'
+    assert breaker.acquire() is None
+
+
+def test_failed_probe():
+    breaker = CircuitBreaker(min_requests=2, recovery_timeout=0.1)
+    open_breaker(breaker)
+    time.sleep(0.15)
+    probe = breaker.acquire()
+    breaker.record(False, probe)
+    assert breaker.state == 'open'
+
+
+def test_late_outcome_not_probe():
+    """Requests sent before the circuit opened should not count as test requests once it is half-open."""
+    breaker = CircuitBreaker(min_requests=2, recovery_timeout=0.1, probes=1)
+    early = breaker.acquire()
+    open_breaker(breaker)
+    time.sleep(0.15)
+    probe = breaker.acquire()
+    # The early request finishing doesn't free up another test request, or change the state
+    breaker.record(True, early)
+    breaker.record(False, early)
+    assert breaker.state == 'half-open'
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(True, probe)
+    assert breaker.state == 'closed'
+
+
+def test_session_circuit(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (503, {}, {'Fault': {'Code': 'PUGREST.ServerBusy'}})
+    breaker = CircuitBreaker(min_requests=3, recovery_timeout=60)
+    transport.set_session(transport.Session(rate_limiter=False, retry=False, circuit_breaker=breaker))
+    for _ in range(3):
+        with pytest.raises(PubChemHTTPError):
+            get_compounds(1)
+    with pytest.raises(CircuitOpenError):
+        get_compounds(1)
+    assert len(fake_pubchem.requests) == 3
+
+
+def test_not_found_is_not_failure(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (404, {}, {'Fault': {'Code': 'PUGREST.NotFound'}})
+    breaker = CircuitBreaker(min_requests=2)
+    transport.set_session(transport.Session(rate_limiter=False, circuit_breaker=breaker))
+    for _ in range(3):
+        with pytest.raises(NotFoundError):
+            Compound.from_cid(999)
+    assert breaker.state == 'closed'
+
+
+def test_serve_stale(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, RECORD)
+    breaker = CircuitBreaker(min_requests=2, recovery_timeout=60)
+    transport.set_session(transport.Session(rate_limiter=False, circuit_breaker=breaker))
+    set_cache(MemoryCache(ttl=0))
+    try:
+        Compound.from_cid(241)
+        open_breaker(breaker)
+        assert Compound.from_cid(241).cid == 241
+        assert len(fake_pubchem.requests) == 1
+        with pytest.raises(CircuitOpenError):
+            Compound.from_cid(2244)
+    finally:
+        set_cache(None)
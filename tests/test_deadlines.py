@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+test_deadlines
+~~~~~~~~~~~~~~
+
+Test request timeouts and overall deadlines.
+
+"""
+
+import threading
+import time
+from urllib.error import URLError
+from urllib.parse import parse_qs
+
+import pytest
+
+from pubchempy import *
+from pubchempy import transport
+from pubchempy.batch import Batcher, MicroBatcher, set_batcher, set_micro_batcher
+from pubchempy.deadlines import deadline, remaining
+from pubchempy.errors import DeadlineExceededError
+
+
+def slow_handler(method, path, body):
+    time.sleep(1)
+    return 200, {}, {'PC_Compounds': []}
+
+
+def test_deadline_context():
+    assert remaining() is None
+    with deadline(10):
+        assert 9 < remaining() <= 10
+        with deadline(20):
+            assert remaining() <= 10
+        with deadline(1):
+            assert remaining() <= 1
+    assert remaining() is None
+
+
+def test_read_timeout(fake_pubchem):
+    fake_pubchem.handler = slow_handler
+    session = transport.Session(timeout=0.2, rate_limiter=False, retry=False)
+    start = time.monotonic()
+    with pytest.raises(URLError):
+        session.request(fake_pubchem.url + '/rest/pug/compound/cid/1/JSON')
+    assert time.monotonic() - start < 0.8
+
+
+def test_deadline_read(fake_pubchem):
+    """The socket timeout should be shortened to fit the deadline."""
+    fake_pubchem.handler = slow_handler
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        Compound.from_cid(1, deadline=0.3)
+    assert time.monotonic() - start < 0.8
+
+
+def test_deadline_retries(fake_pubchem):
+    """Retries should stop once the deadline would be passed."""
+    fake_pubchem.handler = lambda method, path, body: (503, {'Retry-After': '0.2'}, {})
+    transport.set_session(transport.Session(rate_limiter=False, retry=Retry(total=10, backoff_factor=0)))
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        get_compounds(1, deadline=0.5)
+    assert time.monotonic() - start < 0.8
+    assert 2 <= len(fake_pubchem.requests) <= 3
+
+
+def test_deadline_polling(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, {'Waiting': {'ListKey': '123'}})
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        get_cids('CC', 'smiles', searchtype='substructure', deadline=0.5)
+    assert time.monotonic() - start < 0.8
+
+
+def test_deadline_chunks(fake_pubchem):
+    """The deadline should apply to chunks requested in other threads."""
+    fake_pubchem.handler = slow_handler
+    set_batcher(Batcher(chunk_size=2, max_workers=2, adaptive=False))
+    try:
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            get_compounds(list(range(10)), deadline=0.3)
+        assert time.monotonic() - start < 0.8
+    finally:
+        set_batcher(None)
+
+
+def slow_record_handler(method, path, body):
+    time.sleep(0.5)
+    cids = parse_qs(body.decode())['cid'][0].split(',') if body else ['1']
+    return 200, {}, {'PC_Compounds': [{'id': {'id': {'cid': int(cid)}}, 'atoms': {'aid': [1], 'element': [6]}}
+                                      for cid in cids]}
+
+
+def run_with_and_without_deadline(func, first='short'):
+    """Call ``func`` with a short deadline in one thread and with none in another, and return what each got."""
+    outcomes = {}
+
+    def run(name, **kwargs):
+        try:
+            outcomes[name] = func(**kwargs)
+        except Exception as e:
+            outcomes[name] = e
+
+    threads = [threading.Thread(target=run, args=('short',), kwargs={'deadline': 0.2}),
+               threading.Thread(target=run, args=('none',))]
+    if first != 'short':
+        threads.reverse()
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_shared_request_deadline(fake_pubchem):
+    """One caller's deadline should not fail another caller sharing the same request."""
+    fake_pubchem.handler = slow_record_handler
+    outcomes = run_with_and_without_deadline(lambda **kwargs: Compound.from_cid(1, **kwargs))
+    assert isinstance(outcomes['short'], DeadlineExceededError)
+    assert outcomes['none'].cid == 1
+
+
+def test_micro_batch_deadline(fake_pubchem):
+    """A full batch sent under one caller's deadline should not fail the other callers in it."""
+    fake_pubchem.handler = slow_record_handler
+    set_micro_batcher(MicroBatcher(window=1, max_size=2))
+    try:
+        # The caller with a deadline fills the batch, so sends it from its own thread
+        cids = iter([1, 2])
+        outcomes = run_with_and_without_deadline(lambda **kwargs: Compound.from_cid(next(cids), **kwargs), 'none')
+    finally:
+        set_micro_batcher(None)
+    assert isinstance(outcomes['short'], DeadlineExceededError)
+    assert outcomes['none'].cid == 1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+test_hedge
+~~~~~~~~~~
+
+Test hedging slow requests with duplicates.
+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pubchempy import *
+from pubchempy import throttle, transport
+
+
+class CountingRateLimiter(RateLimiter):
+    """Rate limiter that counts the requests it lets through."""
+
+    def __init__(self):
+        super().__init__(((1000, 1.0),))
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        super().acquire()
+
+
+def test_hedge_delay():
+    hedge = Hedge(percentile=90, initial_delay=2.0, min_delay=0.05)
+    assert hedge.delay() == 2.0
+    for latency in range(1, 101):
+        hedge._observe(latency / 1000.0)
+    assert abs(hedge.delay() - 0.091) < 0.001
+    hedge._observe(0.001)
+    assert hedge.delay() >= 0.05
+
+
+def test_hedge_call():
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(1 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    hedge = Hedge(initial_delay=0.1)
+    start = time.monotonic()
+    assert hedge.call(func) == 2
+    assert time.monotonic() - start < 0.5
+    assert hedge.hedged == 1
+    assert hedge.wins == 1
+
+
+def test_unneeded_duplicates_cancelled():
+    """A duplicate still waiting to be sent when the original succeeds should never be sent."""
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(0.3)
+        return 'ok'
+
+    hedge = Hedge(initial_delay=0.05)
+    assert hedge.call(func, prepare=lambda: time.sleep(0.5)) == 'ok'
+    assert hedge.hedged == 1
+    time.sleep(0.5)
+    assert len(calls) == 1
+
+
+def test_no_hedge_when_fast():
+    hedge = Hedge(initial_delay=0.5)
+    assert hedge.call(lambda: 'ok') == 'ok'
+    assert hedge.hedged == 0
+
+
+def test_hedged_requests(fake_pubchem):
+    requests = []
+
+    def handler(method, path, body):
+        requests.append(path)
+        if len(requests) == 1:
+            time.sleep(1)
+        return 200, {}, {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': [1], 'element': [6]}}]}
+
+    fake_pubchem.handler = handler
+    limiter = CountingRateLimiter()
+    hedge = Hedge(initial_delay=0.1)
+    transport.set_session(transport.Session(rate_limiter=limiter, hedge=hedge))
+    start = time.monotonic()
+    assert Compound.from_cid(241).cid == 241
+    assert time.monotonic() - start < 0.8
+    assert hedge.wins == 1
+    # The duplicate went through the rate limiter too
+    assert limiter.acquired == 2
+
+
+def test_rate_limit_wait_not_hedged(fake_pubchem):
+    fake_pubchem.handler = lambda method, path, body: (200, {}, {'ok': True})
+    limiter = CountingRateLimiter()
+    limiter.buckets = [throttle.TokenBucket(5, 0.25)]
+    hedge = Hedge(initial_delay=0.1)
+    session = transport.Session(maxsize=20, rate_limiter=limiter, hedge=hedge)
+    transport.set_session(session)
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        list(executor.map(lambda i: session.request(fake_pubchem.url + '/rest/pug/%s' % i), range(20)))
+    # Callers queue for the rate limiter for up to 0.75s, but the server answers at once, so nothing is duplicated
+    assert hedge.hedged == 0
+    assert limiter.acquired == 20
+    assert len(fake_pubchem.requests) == 20
+
+
+def test_pool_wait_not_hedged(fake_pubchem):
+    def handler(method, path, body):
+        time.sleep(0.05)
+        return 200, {}, {'ok': True}
+
+    fake_pubchem.handler = handler
+    hedge = Hedge(initial_delay=0.3)
+    session = transport.Session(maxsize=1, rate_limiter=False, hedge=hedge)
+    transport.set_session(session)
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        list(executor.map(lambda i: session.request(fake_pubchem.url + '/rest/pug/%s' % i), range(20)))
+    # Callers wait up to 1s for the single connection, but each response only takes 0.05s once sent
+    assert hedge.hedged == 0
+    time.sleep(0.2)
+    assert len(fake_pubchem.requests) == 20
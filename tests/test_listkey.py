@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+test_listkey
+~~~~~~~~~~~~
+
+Test asynchronous listkey searches against a local server.
+
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import BadRequestError, DeadlineExceededError
+
+
+class SearchServer(object):
+    """Handler that answers searches with a listkey and reports them finished after a number of polls."""
+
+    def __init__(self, polls=2):
+        self.polls = polls
+        self.counts = {}
+        self.submitted = 0
+
+    def __call__(self, method, path, body):
+        if '/listkey/' not in path:
+            self.submitted += 1
+            return 202, {}, {'Waiting': {'ListKey': str(self.submitted), 'Message': 'Your request is running'}}
+        listkey = path.split('/listkey/')[1].split('/')[0]
+        self.counts[listkey] = self.counts.get(listkey, 0) + 1
+        if self.counts[listkey] < self.polls:
+            return 202, {}, {'Waiting': {'ListKey': listkey, 'Message': 'Your request is running'}}
+        return 200, {}, {'IdentifierList': {'CID': [int(listkey)]}}
+
+
+def test_get_listkey(fake_pubchem):
+    fake_pubchem.handler = SearchServer(polls=2)
+    start = time.monotonic()
+    assert get_cids('CC', 'smiles', searchtype='substructure') == [1]
+    # Polling starts quickly rather than after a fixed two seconds
+    assert time.monotonic() - start < 1.5
+    assert fake_pubchem.requests[1][1] == '/rest/pug/compound/listkey/1/cids/JSON'
+
+
+def test_wait_all(fake_pubchem):
+    fake_pubchem.handler = SearchServer(polls=3)
+    jobs = [ListKeyJob.submit(s, 'smiles', operation='cids', searchtype='substructure') for s in ['C', 'CC', 'CCC']]
+    assert [job.listkey for job in jobs] == ['1', '2', '3']
+    assert not any(job.done() for job in jobs)
+    results = wait_all(jobs)
+    assert all(job.done() for job in jobs)
+    assert [r for r in results] == [b'{"IdentifierList": {"CID": [%d]}}' % i for i in (1, 2, 3)]
+
+
+def test_wait_timeout(fake_pubchem):
+    fake_pubchem.handler = SearchServer(polls=1000)
+    job = ListKeyJob.submit('CC', 'smiles', operation='cids', searchtype='substructure')
+    with pytest.raises(DeadlineExceededError):
+        job.wait(timeout=0.5)
+
+
+def test_await(fake_pubchem):
+    fake_pubchem.handler = SearchServer(polls=2)
+    jobs = [ListKeyJob.submit(s, 'smiles', operation='cids', searchtype='substructure') for s in ['C', 'CC']]
+
+    async def main():
+        return await asyncio.gather(*jobs)
+
+    assert len(asyncio.run(main())) == 2
+
+
+class StoredSearchServer(object):
+    """Handler that stores search results under a listkey, and can expire it."""
+
+    def __init__(self):
+        self.searches = 0
+        self.expired = set()
+
+    def __call__(self, method, path, body):
+        if '/listkey/' not in path:
+            self.searches += 1
+            assert 'list_return=listkey' in path
+            return 200, {}, {'IdentifierList': {'ListKey': 'lk%s' % self.searches, 'Size': 3}}
+        listkey, operation = path.split('/listkey/')[1].split('/')[:2]
+        if listkey in self.expired:
+            return 400, {}, {'Fault': {'Details': ['Invalid ListKey']}}
+        if operation == 'property' and 'Invalid' in path:
+            return 400, {}, {'Fault': {'Code': 'PUGREST.BadRequest', 'Details': ['Invalid property']}}
+        if operation == 'cids':
+            return 200, {}, {'IdentifierList': {'CID': [1, 2, 3]}}
+        if operation == 'property':
+            return 200, {}, {'PropertyTable': {'Properties': [{'CID': c, 'MolecularWeight': '1'} for c in [1, 2, 3]]}}
+        if operation == 'synonyms':
+            return 200, {}, {'InformationList': {'Information': [{'CID': c, 'Synonym': ['x']} for c in [1, 2, 3]]}}
+        if operation == 'sids':
+            return 404, {}, {'Fault': {'Code': 'PUGREST.NotFound', 'Details': ['No SIDs found']}}
+        return 404, {}, {'Fault': {'Details': ['No data']}}
+
+
+def test_listkey_reuse(fake_pubchem):
+    server = fake_pubchem.handler = StoredSearchServer()
+    lk = ListKey.search('c1ccccc1', 'smiles', searchtype='substructure')
+    assert lk.listkey == 'lk1'
+    assert len(lk) == 3
+    assert lk.cids() == [1, 2, 3]
+    assert [p['CID'] for p in lk.properties('MolecularWeight')] == [1, 2, 3]
+    assert len(lk.synonyms()) == 3
+    assert server.searches == 1
+    assert fake_pubchem.requests[2][1] == '/rest/pug/compound/listkey/lk1/property/MolecularWeight/JSON'
+
+
+def test_listkey_expired(fake_pubchem):
+    server = fake_pubchem.handler = StoredSearchServer()
+    lk = ListKey.search('c1ccccc1', 'smiles', searchtype='substructure')
+    server.expired.add('lk1')
+    assert lk.cids() == [1, 2, 3]
+    assert lk.listkey == 'lk2'
+    assert server.searches == 2
+
+
+def test_listkey_other_errors(fake_pubchem):
+    """Errors that aren't about the listkey itself should not run the search again."""
+    server = fake_pubchem.handler = StoredSearchServer()
+    lk = ListKey.search('c1ccccc1', 'smiles', searchtype='substructure')
+    assert lk.sids() == []
+    with pytest.raises(BadRequestError):
+        lk.properties('Invalid')
+    assert lk.listkey == 'lk1'
+    assert server.searches == 1
+    assert len(fake_pubchem.requests) == 3
+
+
+class PagingServer(object):
+    """Handler that stores 25 results and serves pages of them."""
+
+    def __call__(self, method, path, body):
+        if '/listkey/' not in path:
+            return 200, {}, {'IdentifierList': {'ListKey': 'lk', 'Size': 25}}
+        query = dict(p.split('=') for p in path.split('?')[1].split('&'))
+        cids = list(range(1, 26))[int(query['listkey_start']):][:int(query['listkey_count'])]
+        if '/cids/' in path:
+            return 200, {}, {'IdentifierList': {'CID': cids}}
+        if '/property/' in path:
+            return 200, {}, {'PropertyTable': {'Properties': [{'CID': c} for c in cids]}}
+        return 200, {}, {'PC_Compounds': [{'id': {'id': {'cid': c}}, 'atoms': {'aid': [], 'element': []}}
+                                          for c in cids]}
+
+
+def test_iter_cids(fake_pubchem):
+    fake_pubchem.handler = PagingServer()
+    assert list(iter_cids('C10H21N', 'formula', page_size=10)) == list(range(1, 26))
+    # One search and three pages
+    assert len(fake_pubchem.requests) == 4
+
+
+def test_iter_compounds(fake_pubchem):
+    fake_pubchem.handler = PagingServer()
+    compounds = iter_compounds('C10H21N', 'formula', page_size=10)
+    assert next(compounds).cid == 1
+    assert [c.cid for c in compounds] == list(range(2, 26))
+
+
+def test_iter_properties(fake_pubchem):
+    fake_pubchem.handler = PagingServer()
+    rows = iter_properties('MolecularWeight', 'C10H21N', 'formula', page_size=7)
+    assert [r['CID'] for r in rows] == list(range(1, 26))
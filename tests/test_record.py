@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+test_record
+~~~~~~~~~~~
+
+Test parsing Compound records without making requests.
+
+"""
+
+import copy
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import PubChemPyDeprecationWarning, ResponseParseError
+from pubchempy.functions import _parse_prop
+
+
+RECORD = {
+    'id': {'id': {'cid': 702}},
+    'atoms': {'aid': [3, 1, 2], 'element': [8, 6, 6], 'charge': [{'aid': 3, 'value': -1}]},
+    'bonds': {'aid1': [1, 2], 'aid2': [2, 3], 'order': [1, 1]},
+    'coords': [{
+        'type': [1, 5, 255],
+        'aid': [3, 1, 2],
+        'conformers': [{
+            'x': [3.7321, 2.0, 2.866],
+            'y': [0.0, 0.0, 0.5],
+            'style': {'aid1': [1], 'aid2': [2], 'annotation': [8]},
+        }],
+    }],
+    'props': [
+        {'urn': {'label': 'Molecular Formula', 'datatype': 1}, 'value': {'sval': 'C2H5O-'}},
+        {'urn': {'label': 'Molecular Weight', 'datatype': 1}, 'value': {'sval': '45.06'}},
+        {'urn': {'label': 'SMILES', 'name': 'Canonical', 'datatype': 1}, 'value': {'sval': 'CC[O-]'}},
+        {'urn': {'label': 'SMILES', 'name': 'Isomeric', 'datatype': 1}, 'value': {'sval': 'CC[O-]'}},
+        {'urn': {'label': 'Log P', 'name': 'XLogP3', 'datatype': 7}, 'value': {'fval': -0.1}},
+        {'urn': {'label': 'Topological', 'name': 'Polar Surface Area', 'implementation': 'E_TPSA'},
+         'value': {'fval': 23.1}},
+    ],
+}
+
+
+@pytest.fixture
+def record():
+    return copy.deepcopy(RECORD)
+
+
+def test_atoms(record):
+    c = Compound(record)
+    assert [a.aid for a in c.atoms] == [1, 2, 3]
+    assert c.elements == ['C', 'C', 'O']
+    assert c.atoms[2].charge == -1
+    assert (c.atoms[0].x, c.atoms[0].y, c.atoms[0].z) == (2.0, 0.0, None)
+    assert [(b.aid1, b.aid2, b.style) for b in c.bonds] == [(1, 2, 8), (2, 3, None)]
+
+
+def test_properties(record):
+    c = Compound(record)
+    assert c.cid == 702
+    assert c.molecular_formula == 'C2H5O-'
+    assert c.isomeric_smiles == 'CC[O-]'
+    assert c.xlogp == -0.1
+    assert c.tpsa == 23.1
+    assert c.inchikey is None
+
+
+def test_lazy_atoms(record):
+    """Malformed atoms should only cause an error when they are used or validated."""
+    record['atoms']['element'].pop()
+    c = Compound(record)
+    assert c.cid == 702
+    assert c.molecular_weight == '45.06'
+    with pytest.raises(ResponseParseError):
+        c.validate()
+    with pytest.raises(ResponseParseError):
+        c.atoms
+    record['bonds']['order'].pop()
+    with pytest.raises(ResponseParseError):
+        c.bonds
+
+
+def test_record_reassignment(record):
+    c = Compound(record)
+    assert len(c.atoms) == 3
+    record = copy.deepcopy(record)
+    record['atoms'] = {'aid': [1], 'element': [6]}
+    del record['coords']
+    del record['bonds']
+    c.record = record
+    assert c.elements == ['C']
+    assert c.bonds == []
+
+
+def test_atom_slots(record):
+    c = Compound(record)
+    atom = c.atoms[2]
+    assert not hasattr(atom, '__dict__')
+    assert not hasattr(c.bonds[0], '__dict__')
+    assert atom.to_dict() == {'aid': 3, 'number': 8, 'element': 'O', 'x': 3.7321, 'y': 0.0, 'charge': -1}
+    assert c.atoms[0].to_dict() == {'aid': 1, 'number': 6, 'element': 'C', 'x': 2.0, 'y': 0.0}
+
+
+def test_deprecated_dict_access(record):
+    c = Compound(record)
+    atom, bond = c.atoms[0], c.bonds[0]
+    with pytest.warns(PubChemPyDeprecationWarning):
+        assert atom['element'] == 'C'
+    with pytest.warns(PubChemPyDeprecationWarning):
+        atom['x'] = 1.5
+    assert atom.x == 1.5
+    # Arbitrary keys can no longer be stored
+    with pytest.warns(PubChemPyDeprecationWarning):
+        with pytest.raises(KeyError):
+            atom['label'] = 'a'
+    with pytest.warns(PubChemPyDeprecationWarning):
+        with pytest.raises(KeyError):
+            bond['label'] = 'b'
+    with pytest.warns(PubChemPyDeprecationWarning):
+        assert 'z' not in atom
+    with pytest.warns(PubChemPyDeprecationWarning):
+        assert bond['style'] == 8
+
+
+def test_arrays(record):
+    np = pytest.importorskip('numpy')
+    c = Compound(record)
+    assert c.atomic_numbers.tolist() == [a.number for a in c.atoms]
+    assert c.charges.tolist() == [0, 0, -1]
+    assert c.coords.shape == (3, 2)
+    assert c.coords.tolist() == [[a.x, a.y] for a in c.atoms]
+    assert np.allclose(c.coords.mean(axis=0), [2.8660333, 0.1666667])
+    record['coords'][0]['conformers'][0]['z'] = [1.0, 2.0, 3.0]
+    assert c.coords[:, 2].tolist() == [2.0, 3.0, 1.0]
+    del record['coords']
+    assert c.coords is None
+
+
+def test_props_index(record):
+    """Indexed property lookups should match a linear scan of the props."""
+    c = Compound(record)
+    for search in [{'label': 'SMILES'}, {'label': 'SMILES', 'name': 'Isomeric'}, {'implementation': 'E_TPSA'},
+                   {'label': 'Log P', 'name': 'XLogP3'}, {'label': 'InChI'}, {'name': 'Canonical'}]:
+        assert c._parse_prop(search, record['props']) == _parse_prop(search, record['props'])
+    record = copy.deepcopy(record)
+    record['props'][0]['value']['sval'] = 'C2H6O'
+    c.record = record
+    assert c.molecular_formula == 'C2H6O'
+
+
+def test_conformer_data(record):
+    record['coords'][0]['conformers'][0]['data'] = [
+        {'urn': {'label': 'Shape', 'name': 'Volume'}, 'value': {'fval': 42.5}},
+        {'urn': {'label': 'Conformer', 'name': 'ID'}, 'value': {'sval': '000002BE00000001'}},
+    ]
+    c = Compound(record)
+    assert c.volume_3d == 42.5
+    assert c.conformer_id_3d == '000002BE00000001'
+    assert c.mmff94_energy_3d is None
+
+
+def test_atom_bond_lookup(record):
+    c = Compound(record)
+    assert c.atom(3).element == 'O'
+    assert c.bond(2, 1) is c.bond(1, 2)
+    assert c.bond(1, 2).style == 8
+    with pytest.raises(KeyError):
+        c.atom(4)
+    with pytest.raises(KeyError):
+        c.bond(1, 3)
+
+
+def test_sorted_views_cached(record):
+    c = Compound(record)
+    atoms = c.atoms
+    atoms.pop()
+    assert len(c.atoms) == 3
+    assert c.atoms[0] is atoms[0]
+    assert c.bonds[1] is c.bond(2, 3)
+    record = copy.deepcopy(record)
+    record['atoms'] = {'aid': [2, 1], 'element': [7, 6]}
+    del record['coords']
+    record['bonds'] = {'aid1': [1], 'aid2': [2], 'order': [3]}
+    c.record = record
+    assert c.elements == ['C', 'N']
+    assert [b.order for b in c.bonds] == [3]
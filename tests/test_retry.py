@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+test_retry
+~~~~~~~~~~
+
+Test retrying transient errors.
+
+"""
+
+import io
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import NotFoundError, ServerError
+
+
+def flaky(failures, status=503, headers=None):
+    """Return a handler that fails with the given status a number of times before succeeding."""
+    calls = []
+
+    def handler(method, path, body):
+        calls.append(path)
+        if len(calls) <= failures:
+            return status, headers or {}, {'Fault': {'Code': 'PUGREST.ServerBusy'}}
+        return 200, {}, {'ok': True}
+    return handler
+
+
+def test_backoff():
+    retry = Retry(backoff_factor=0.5, backoff_max=3, jitter=False)
+    assert [retry.get_backoff(n) for n in range(5)] == [0.5, 1, 2, 3, 3]
+    retry = Retry(backoff_factor=0.5, jitter=True)
+    assert all(0 <= retry.get_backoff(2) <= 2 for _ in range(20))
+
+
+def test_retry_after():
+    retry = Retry(backoff_factor=0.1, jitter=False)
+    error = HTTPError('url', 503, 'Busy', {'Retry-After': '7'}, io.BytesIO())
+    assert retry.get_delay(0, error) == 7
+    assert Retry(respect_retry_after=False, jitter=False, backoff_factor=0.1).get_delay(0, error) == 0.1
+
+
+def test_is_retryable():
+    retry = Retry()
+    assert retry.is_retryable(HTTPError('url', 503, 'Busy', {}, io.BytesIO()))
+    assert retry.is_retryable(URLError(ConnectionResetError()))
+    assert not retry.is_retryable(HTTPError('url', 404, 'Not found', {}, io.BytesIO()))
+    assert not retry.is_retryable(HTTPError('url', 400, 'Bad request', {}, io.BytesIO()))
+
+
+def test_retry_transient(fake_pubchem):
+    get_session().retry = Retry(total=3, backoff_factor=0.01)
+    fake_pubchem.handler = flaky(2)
+    assert get_json(1) == {'ok': True}
+    assert len(fake_pubchem.requests) == 3
+
+
+def test_retry_exhausted(fake_pubchem):
+    get_session().retry = Retry(total=2, backoff_factor=0.01)
+    fake_pubchem.handler = flaky(5, status=500)
+    with pytest.raises(ServerError):
+        get_json(1)
+    assert len(fake_pubchem.requests) == 3
+
+
+def test_no_retry_not_found(fake_pubchem):
+    get_session().retry = Retry(total=3, backoff_factor=0.01)
+    fake_pubchem.handler = flaky(5, status=404)
+    with pytest.raises(NotFoundError):
+        request(1)
+    assert len(fake_pubchem.requests) == 1
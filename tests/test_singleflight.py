@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+test_singleflight
+~~~~~~~~~~~~~~~~~
+
+Test coalescing of identical concurrent requests.
+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import NotFoundError
+from pubchempy.singleflight import SingleFlight
+
+
+RECORD = {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': [1], 'element': [6]}}]}
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    calls = []
+
+    def call(key):
+        def func():
+            calls.append(key)
+            time.sleep(0.2)
+            return key.upper()
+        return flight.do(key, func)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(call, ['a'] * 4 + ['b']))
+    assert results == ['A', 'A', 'A', 'A', 'B']
+    assert sorted(calls) == ['a', 'b']
+    assert flight.shared == 3
+    # Later calls are not coalesced with finished ones
+    call('a')
+    assert len(calls) == 3
+
+
+def test_coalesced_requests(fake_pubchem):
+    def handler(method, path, body):
+        time.sleep(0.2)
+        return 200, {}, RECORD
+
+    fake_pubchem.handler = handler
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        compounds = list(executor.map(lambda _: Compound.from_cid(241), range(8)))
+    assert [c.cid for c in compounds] == [241] * 8
+    assert len(fake_pubchem.requests) == 1
+
+
+def test_coalesced_errors(fake_pubchem):
+    def handler(method, path, body):
+        time.sleep(0.2)
+        return 404, {}, {'Fault': {'Code': 'PUGREST.NotFound', 'Message': 'No CID found'}}
+
+    fake_pubchem.handler = handler
+
+    def from_cid(_):
+        with pytest.raises(NotFoundError):
+            Compound.from_cid(999999999)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(from_cid, range(4)))
+    assert len(fake_pubchem.requests) == 1
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+test_throttle
+~~~~~~~~~~~~~
+
+Test client-side rate limiting.
+
+"""
+
+import pytest
+
+from pubchempy import *
+
+
+def test_burst_then_wait():
+    """Requests within the burst capacity are immediate, later ones are spaced out at the refill rate."""
+    limiter = RateLimiter(limits=[(5, 1.0)])
+    delays = [limiter.reserve() for _ in range(7)]
+    assert delays[:5] == [0.0] * 5
+    assert delays[5] == pytest.approx(0.2, abs=0.01)
+    assert delays[6] == pytest.approx(0.4, abs=0.01)
+
+
+def test_multiple_limits():
+    """The most restrictive limit should determine the delay."""
+    limiter = RateLimiter(limits=[(5, 1.0), (6, 60.0)])
+    delays = [limiter.reserve() for _ in range(7)]
+    assert delays[6] == pytest.approx(10.0, abs=0.1)
+
+
+def test_throttling_header():
+    """The request rate should drop when PubChem reports it is busy and recover gradually."""
+    limiter = RateLimiter()
+    limiter.update({'X-Throttling-Control': 'Request Count status: Yellow (60%), Request Time status: Green (10%), '
+                                            'Service status: Green (20%)'})
+    assert limiter.status == 'yellow'
+    assert limiter.factor == 0.5
+    limiter.update({'X-Throttling-Control': 'Request Count status: Red (80%), Request Time status: Green (10%), '
+                                            'Service status: Green (20%)'})
+    assert limiter.factor == 0.2
+    limiter.update({'X-Throttling-Control': 'Request Count status: Green (0%), Request Time status: Green (0%), '
+                                            'Service status: Green (20%)'})
+    assert limiter.status == 'green'
+    assert 0.2 < limiter.factor < 1.0
+
+
+def test_session_rate_limit(fake_pubchem):
+    """The session should feed response headers back into its rate limiter."""
+    header = 'Request Count status: Red (80%), Request Time status: Red (90%), Service status: Green (20%)'
+    fake_pubchem.handler = lambda method, path, body: (200, {'X-Throttling-Control': header}, {})
+    limiter = RateLimiter()
+    get_session().rate_limiter = limiter
+    get_json(1)
+    assert limiter.status == 'red'
+    assert limiter.factor == 0.2
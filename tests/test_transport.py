@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+test_transport
+~~~~~~~~~~~~~~
+
+Test the pooled keep-alive transport against a local server.
+
+"""
+
+import base64
+import gzip
+import json
+import zlib
+from urllib.error import URLError
+
+import pytest
+
+from pubchempy import *
+from pubchempy.errors import NotFoundError
+
+
+def test_connection_reuse(fake_pubchem):
+    """Consecutive requests should reuse a single keep-alive connection."""
+    for cid in range(1, 6):
+        assert get_json(cid) == {}
+    assert len(fake_pubchem.requests) == 5
+    assert fake_pubchem.connections == 1
+
+
+def test_response_interface(fake_pubchem):
+    """Responses should behave like those returned by urlopen."""
+    fake_pubchem.handler = lambda method, path, body: (200, {'Content-Type': 'chemical/x-mdl-sdfile'}, b'SDF')
+    response = request(241, output='SDF')
+    assert response.getcode() == 200
+    assert response.code == 200
+    assert response.headers['Content-Type'] == 'chemical/x-mdl-sdfile'
+    assert response.read() == b'SDF'
+
+
+def test_post_identifier(fake_pubchem):
+    """Identifier lists should be sent as POST data."""
+    get_json([1, 2, 3], operation='cids')
+    method, path, body, headers = fake_pubchem.requests[0]
+    assert method == 'POST'
+    assert path == '/rest/pug/compound/cid/cids/JSON'
+    assert body == b'cid=1%2C2%2C3'
+
+
+def test_http_error(fake_pubchem):
+    """Error status codes should still be mapped to PubChemHTTPError subclasses."""
+    fault = {'Fault': {'Code': 'PUGREST.NotFound', 'Details': ['No CID found']}}
+    fake_pubchem.handler = lambda method, path, body: (404, {'Content-Type': 'application/json'}, fault)
+    with pytest.raises(NotFoundError):
+        request(999999999)
+    assert get_json(999999999) is None
+
+
+def test_stale_connection(fake_pubchem):
+    """A keep-alive connection closed by the server should be replaced transparently."""
+    get_json(1)
+    fake_pubchem.handler = lambda method, path, body: (200, {'Connection': 'close'}, {})
+    get_json(2)
+    fake_pubchem.handler = lambda method, path, body: (200, {}, {})
+    get_json(3)
+    assert fake_pubchem.connections == 2
+
+
+@pytest.mark.parametrize('encoding, compress', [
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress),
+    ('deflate', lambda data: zlib.compress(data)[2:-4]),
+])
+def test_compressed_response(fake_pubchem, encoding, compress):
+    """Compressed responses should be requested and transparently decompressed."""
+    record = {'PC_Compounds': [{'id': {'id': {'cid': 241}}, 'atoms': {'aid': list(range(1000))}}]}
+    body = json.dumps(record).encode()
+    fake_pubchem.handler = lambda method, path, data: (200, {'Content-Encoding': encoding}, compress(body))
+    response = request(241)
+    assert response.read() == body
+    assert 'Content-Encoding' not in response.headers
+    assert 'gzip' in fake_pubchem.requests[0][3]['Accept-Encoding']
+    assert get_json(241) == record
+
+
+def test_proxy_credentials(fake_pubchem, monkeypatch):
+    """Credentials in the proxy URL should be sent when opening the tunnel."""
+    fake_pubchem.handler = lambda method, path, body: (407, {}, b'')
+    for name in ['HTTPS_PROXY', 'https_proxy']:
+        monkeypatch.setenv(name, fake_pubchem.url.replace('http://', 'http://user:p%40ss@'))
+    for name in ['NO_PROXY', 'no_proxy']:
+        monkeypatch.delenv(name, raising=False)
+    session = Session(rate_limiter=False, retry=False)
+    with pytest.raises(URLError):
+        session.request('https://pubchem.example.com/rest/pug/compound/cid/241/JSON')
+    method, path, body, headers = fake_pubchem.requests[0]
+    assert (method, path) == ('CONNECT', 'pubchem.example.com:443')
+    assert headers['Proxy-Authorization'] == 'Basic %s' % base64.b64encode(b'user:p@ss').decode()